@@ -1,71 +1,187 @@
-import librosa
 import numpy as np
-import sounddevice as sd
-import queue
 import threading
 import time
-from scipy.spatial.distance import cdist
+from capture import INPUT, open_source
+from contour import ReferenceContour, hz_to_midi, semitone_scores
+from dtw import StreamingDTW
+from pitch_cache import PitchTrackCache
+from pitch_filters import CONFIDENCE_THRESHOLD
+from ring_buffer import AudioRingBuffer, HistoryBuffer
+from scoring import SILENCE_DB
+from songs import load_lyrics
+from yin import YinStream, frame_count, frames, level_db, yin
 
 # ==== SETTINGS ====
 REF_PATH = "ref.wav"                   # Reference song file (wav format)
-CHUNK_DURATION = 2.0                   # Seconds per audio chunk
+REF_LYRICS = None                      # Lyric table (JSON) to use as the reference instead
 SAMPLE_RATE = 22050                    # Audio sample rate
+FMIN = 65.40639132514966              # Lowest pitch YIN searches for (C2)
+FMAX = 2093.004522404789               # Highest pitch YIN searches for (C7)
+FRAME_LENGTH = 2048                    # YIN analysis frame
+HOP_LENGTH = FRAME_LENGTH // 4         # YIN hop
+YIN_THRESHOLD = 0.1                    # CMND dip that counts as the period
+MIN_CONFIDENCE = CONFIDENCE_THRESHOLD  # Frames below this confidence, or quieter than
+                                       # SILENCE_DB, are unvoiced (NaN) in both contours
+DTW_BAND_SECONDS = 2.0                 # How far the singer may drift from the tracked position
+SCORE_WINDOW = 2.0                     # Seconds of singing each reported score covers
+BUFFER_SECONDS = 2.0                   # Capture audio kept while analysis catches up
 
 # ==== LOAD REFERENCE ====
-ref_audio, sr = librosa.load(REF_PATH, sr=SAMPLE_RATE)
-ref_pitch = librosa.yin(ref_audio, fmin=librosa.note_to_hz('C2'), fmax=librosa.note_to_hz('C7'))
+# The reference contour (MIDI per YIN frame) is built on first use; from the
+# reference audio it is cached on disk, so importing this module does not
+# decode or analyse any audio.  librosa is slow to import and only imported
+# to decode the reference.
+pitch_cache = PitchTrackCache()
+_ref_contour = None
 
-# ==== AUDIO QUEUE SETUP ====
-audio_queue = queue.Queue()
+def analysis_params():
+    return {
+        "sr": SAMPLE_RATE,
+        "fmin": float(FMIN),
+        "fmax": float(FMAX),
+        "frame_length": FRAME_LENGTH,
+        "hop_length": HOP_LENGTH,
+        "threshold": YIN_THRESHOLD,
+        "min_confidence": MIN_CONFIDENCE,
+        "silence_db": SILENCE_DB,
+    }
 
-def audio_callback(indata, frames, time_info, status):
-    audio_queue.put(indata.copy().flatten())
+def analyse_reference(path):
+    import librosa
+    ref_audio, _ = librosa.load(path, sr=SAMPLE_RATE)
+    return get_pitch_seq(ref_audio)
 
-def start_stream():
-    stream = sd.InputStream(callback=audio_callback,
-                            channels=1,
-                            samplerate=SAMPLE_RATE,
-                            blocksize=int(SAMPLE_RATE * CHUNK_DURATION))
+def get_ref_contour():
+    global _ref_contour
+    if _ref_contour is None:
+        frame_rate = SAMPLE_RATE / HOP_LENGTH
+        if REF_LYRICS:
+            _ref_contour = ReferenceContour.from_lyrics(load_lyrics(REF_LYRICS), frame_rate=frame_rate)
+        else:
+            params = dict(analysis_params(), unit="midi")
+            midi = pitch_cache.get(REF_PATH, params,
+                                   lambda: hz_to_midi(analyse_reference(REF_PATH)).astype(np.float32))
+            _ref_contour = ReferenceContour(midi, frame_rate)
+    return _ref_contour
+
+# ==== AUDIO BUFFER SETUP ====
+# The capture callback delivers one hop at a time into a ring buffer; the
+# analysis loop wakes as soon as a hop is there and passes whatever arrived
+# to a YinStream, which returns the FRAME_LENGTH frames it completed.
+audio_buffer = AudioRingBuffer(max(int(SAMPLE_RATE * BUFFER_SECONDS), FRAME_LENGTH))
+capture_mark = (0, time.perf_counter())  # (write_index, perf_counter) of the latest block
+data_ready = threading.Event()
+
+def audio_callback(block, captured_at):
+    global capture_mark
+    audio_buffer.write(block[:, 0])
+    capture_mark = (audio_buffer.write_index, captured_at)
+    data_ready.set()
+
+def start_stream(spec=INPUT):
+    # Microphone by default; a WAV path or "synth:<hz>" replays instead (capture.py)
+    stream = open_source(spec, channels=1, sample_rate=SAMPLE_RATE, block_size=HOP_LENGTH)
+    stream.add_sink(audio_callback)
     stream.start()
     return stream
 
 # ==== AUDIO PITCH ANALYSIS ====
-def get_pitch_seq(y):
+YIN_OPTIONS = {"fmin": FMIN, "fmax": FMAX, "threshold": YIN_THRESHOLD}
+
+def voiced_pitch(pitch, confidence, levels):
+    # YIN reports a pitch (near FMAX) even for silence and noise; keep it only
+    # where the frame is confident and loud enough, else 0 (NaN as MIDI), so
+    # rests in the reference and silence from the singer are not scored,
+    # like unvoiced hops in the game
+    return np.where((confidence >= MIN_CONFIDENCE) & (levels >= SILENCE_DB), pitch, 0).astype(np.float32)
+
+def get_pitch_seq(y, center=True):
+    # Voiced YIN pitch (Hz, 0 where unvoiced) of every frame of `y`; always
+    # frame_count() values
     try:
-        pitch = librosa.yin(y, fmin=librosa.note_to_hz('C2'), fmax=librosa.note_to_hz('C7'))
-        return pitch
+        view = frames(y, FRAME_LENGTH, HOP_LENGTH, center)
+        pitch, confidence = yin(view, SAMPLE_RATE, **YIN_OPTIONS)
+        return voiced_pitch(pitch, confidence, level_db(view))
     except Exception as e:
         print("Pitch error:", e)
-        return np.zeros(len(y))
+        return np.zeros(frame_count(len(y), FRAME_LENGTH, HOP_LENGTH, center), dtype=np.float32)
+
+def pitch_stream():
+    # Streaming front end producing the frames of get_pitch_seq(y, center=False)
+    return YinStream(SAMPLE_RATE, FRAME_LENGTH, HOP_LENGTH, **YIN_OPTIONS)
 
 # ==== SCORE CALCULATION ====
-def compute_score(ref, user):
-    ref = ref[:len(user)]
-    ref = ref.reshape(-1, 1)
-    user = user.reshape(-1, 1)
-    dist = cdist(ref, user, 'euclidean')
+# A single streaming aligner follows the singer through the reference across
+# chunks instead of re-aligning every chunk against the start of the song.
+# It works in MIDI notes, so each frame's alignment cost is its semitone
+# error and is scored with the same rule as the game's notes.  The reported
+# score is the mean frame score over the last SCORE_WINDOW seconds.
+_scorer = None
+_recent_scores = HistoryBuffer(int(SCORE_WINDOW * SAMPLE_RATE / HOP_LENGTH))
+
+def get_scorer():
+    global _scorer
+    if _scorer is None:
+        radius = int(DTW_BAND_SECONDS * SAMPLE_RATE / HOP_LENGTH)
+        _scorer = StreamingDTW(get_ref_contour().filled(), radius=radius)
+    return _scorer
+
+def compute_score(user):
     try:
-        dtw_dist = librosa.sequence.dtw(C=dist)[0][-1, -1]
-        score = 100 * np.exp(-dtw_dist / 1000)  # Convert distance to score
-        return int(score)
+        sung = hz_to_midi(user)
+        for x in sung[~np.isnan(sung)]:
+            _recent_scores.append(semitone_scores(get_scorer().update([x])))
+        if not len(_recent_scores):
+            return 0
+        return int(_recent_scores.latest(_recent_scores.capacity).mean())
     except Exception as e:
         print("DTW error:", e)
         return 0
 
 # ==== AUDIO PROCESSING LOOP ====
-def process_loop():
+def print_score(score, latency):
+    print(f"\rScore: {score:3d}  ({latency * 1000:.0f} ms)", end="", flush=True)
+
+def warm_up():
+    # Build the reference (importing librosa if it has to be analysed), so
+    # the first hop is not scored late
+    get_scorer()
+
+def process_loop(on_score=print_score):
+    # Score every hop as soon as its audio arrives; on_score(score, latency)
+    # gets the time from the end of the hop's capture to its score.  Warm up
+    # first, then drop the audio captured meanwhile
+    warm_up()
+    audio_buffer.read_latest(0)
+    stream = pitch_stream()
+    start = audio_buffer.read_index    # Buffer index of the stream's first sample
     print("🎤 Start singing...")
     while True:
-        if not audio_queue.empty():
-            chunk = audio_queue.get()
-            y = chunk.astype(np.float32)
-            pitch_seq = get_pitch_seq(y)
-            ref_window = ref_pitch[:len(pitch_seq)]
-            score = compute_score(ref_window, pitch_seq)
-            print(f"Score: {score}")
-        time.sleep(CHUNK_DURATION)
+        data_ready.wait()
+        data_ready.clear()
+        block = audio_buffer.read(audio_buffer.available())
+        if audio_buffer.read_index - len(block) != start + stream.samples_seen:
+            # Audio was dropped: frames cannot span the gap
+            stream.reset()
+            start = audio_buffer.read_index - len(block)
+        ends, pitches, confidences, levels = stream.process(block)
+        pitches = voiced_pitch(pitches, confidences, levels)
+        mark_index, mark_time = capture_mark
+        for end, pitch in zip(ends, pitches):
+            captured_at = mark_time - (mark_index - (start + end)) / SAMPLE_RATE
+            on_score(compute_score(pitch[np.newaxis]), time.perf_counter() - captured_at)
 
 # ==== MAIN START ====
-stream = start_stream()
-process_thread = threading.Thread(target=process_loop)
-process_thread.start()
+def main(spec=INPUT):
+    # The reference is analysed while the input device opens
+    warm_up_thread = threading.Thread(target=warm_up, daemon=True)
+    warm_up_thread.start()
+    stream = start_stream(spec)
+    warm_up_thread.join()
+    try:
+        process_loop()
+    finally:
+        stream.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import argparse
+import csv
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from scoring import load_wav, note_columns, pitch_track
+from songs import example_lyrics, load_lyrics
+
+# Batch rescoring of stored performances.
+#
+# Jobs are (recording, lyrics file, song duration) triples, read either from
+# a CSV manifest or by scanning a directory for WAV files (a WAV's lyrics are
+# the JSON file with the same name next to it, or the --lyrics default).
+# Every job is independent, so they are spread over a process pool; within a
+# job the note scoring is done as array operations on the whole song.
+# Results are written as one column per field into a .npz file.
+
+# ==== JOBS ====
+def jobs_from_manifest(path):
+    # CSV with columns: recording, lyrics (optional), duration (optional).
+    # Relative paths are resolved against the manifest's directory.
+    base = os.path.dirname(os.path.abspath(path))
+    jobs = []
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            lyrics = row.get("lyrics") or None
+            jobs.append((
+                os.path.join(base, row["recording"]),
+                os.path.join(base, lyrics) if lyrics else None,
+                float(row.get("duration") or 0),
+            ))
+    return jobs
+
+def jobs_from_directory(path, lyrics=None, duration=0):
+    jobs = []
+    for name in sorted(os.listdir(path)):
+        if not name.lower().endswith(".wav"):
+            continue
+        recording = os.path.join(path, name)
+        sidecar = os.path.splitext(recording)[0] + ".json"
+        jobs.append((recording, sidecar if os.path.exists(sidecar) else lyrics, duration))
+    return jobs
+
+# ==== WORKER ====
+def score_job(job):
+    # Returns (summary, per-note columns); runs in a pool worker
+    recording, lyrics_path, duration = job
+    try:
+        lyrics_data = load_lyrics(lyrics_path) if lyrics_path else example_lyrics
+        samples, sample_rate = load_wav(recording)
+        times, _, _, smoothed = pitch_track(samples, sample_rate)
+        columns = note_columns(lyrics_data, times, smoothed, duration)
+        scores = columns[4]
+        scored = scores >= 0
+        summary = (int(scores[scored].sum()), 100 * int(scored.sum()),
+                   len(samples) / sample_rate, "")
+        return summary, columns
+    except Exception as e:
+        empty = np.zeros(0)
+        return (0, 0, 0.0, f"{type(e).__name__}: {e}"), (empty, empty.astype(int), empty, empty, empty.astype(int))
+
+# ==== OUTPUT ====
+def write_results(path, jobs, results):
+    score = np.array([r[0][0] for r in results], dtype=np.int64)
+    max_score = np.array([r[0][1] for r in results], dtype=np.int64)
+    notes = [r[1] for r in results]
+    counts = np.array([len(n[0]) for n in notes], dtype=np.int64)
+    np.savez(
+        path,
+        recording=np.array([job[0] for job in jobs]),
+        lyrics=np.array([job[1] or "" for job in jobs]),
+        score=score,
+        max_score=max_score,
+        percent=np.where(max_score > 0, 100 * score / np.maximum(max_score, 1), 0.0),
+        seconds=np.array([r[0][2] for r in results]),
+        error=np.array([r[0][3] for r in results]),
+        # Per-note columns; note_recording points back into the rows above
+        note_recording=np.repeat(np.arange(len(results)), counts),
+        note_time=np.concatenate([n[0] for n in notes]) if notes else np.zeros(0),
+        note_index=np.concatenate([n[1] for n in notes]) if notes else np.zeros(0, dtype=int),
+        note_expected=np.concatenate([n[2] for n in notes]) if notes else np.zeros(0),
+        note_sung=np.concatenate([n[3] for n in notes]) if notes else np.zeros(0),
+        note_score=np.concatenate([n[4] for n in notes]) if notes else np.zeros(0, dtype=int),
+    )
+
+def rescore(jobs, output, workers=None):
+    workers = workers or os.cpu_count() or 1
+    # A few jobs per task keeps pickling overhead low without starving workers
+    chunksize = max(1, len(jobs) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(score_job, jobs, chunksize=chunksize))
+    write_results(output, jobs, results)
+    return results
+
+# ==== COMMAND LINE ====
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rescore many recorded performances in parallel")
+    parser.add_argument("source", help="Directory of WAV files or a CSV manifest")
+    parser.add_argument("-o", "--output", default="scores.npz", help="Columnar results file")
+    parser.add_argument("--lyrics", help="Default JSON lyric file for a directory scan")
+    parser.add_argument("--duration", type=float, default=0, help="Default song length for looping")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="Worker processes")
+    args = parser.parse_args(argv)
+
+    if os.path.isdir(args.source):
+        jobs = jobs_from_directory(args.source, args.lyrics, args.duration)
+    else:
+        jobs = jobs_from_manifest(args.source)
+
+    start = time.perf_counter()
+    results = rescore(jobs, args.output, args.workers)
+    elapsed = time.perf_counter() - start
+    audio_seconds = sum(r[0][2] for r in results)
+    failed = sum(1 for r in results if r[0][3])
+    print(f"Scored {len(jobs)} recordings ({audio_seconds:.0f}s of audio) in {elapsed:.1f}s, "
+          f"{failed} failed -> {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import aubio
+import librosa
+import numpy as np
+
+from dtw import StreamingDTW
+from scoring import BUFFER_SIZE, pitch_track
+from yin import yin_signal
+
+# Reproducible benchmarks for pitch detection, DTW scoring and rendering.
+#
+# Every input is synthesised from a fixed seed, so two runs on the same
+# machine measure the same work.  Each benchmark reports the median of
+# several repeats, normalised to a unit that is comparable across changes
+# (seconds per second of audio, per chunk or per frame).  Results are saved
+# as JSON; --compare checks a run against a saved baseline and exits
+# non-zero if anything got slower than the allowed threshold.
+
+# ==== SETTINGS ====
+SAMPLE_RATES = (22050, 44100)
+SIGNAL_SECONDS = 5.0
+DTW_CHUNK_FRAMES = (11, 43, 87, 173)   # ~0.25 s, 1 s, 2 s, 4 s at hop 512 / 22.05 kHz
+DTW_REFERENCE_FRAMES = 43 * 300        # Five-minute reference contour
+LYRIC_COUNTS = (10, 100, 1000, 10000)
+RENDER_FRAMES = 120
+SEED = 1234
+
+# ==== SYNTHETIC SIGNALS ====
+def make_signal(kind, sample_rate, seconds=SIGNAL_SECONDS):
+    rng = np.random.default_rng(SEED)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    if kind == "sweep":
+        # Exponential sweep C2 -> C6
+        f0, f1 = 65.4, 1046.5
+        k = np.log(f1 / f0) / seconds
+        y = 0.5 * np.sin(2 * np.pi * f0 * (np.exp(k * t) - 1) / k)
+    elif kind == "vibrato":
+        # A3 with 6 Hz, +-half-semitone vibrato
+        freq = 220 * 2 ** (0.5 / 12 * np.sin(2 * np.pi * 6 * t))
+        y = 0.5 * np.sin(2 * np.pi * np.cumsum(freq) / sample_rate)
+    elif kind == "noise":
+        y = 0.3 * rng.standard_normal(len(t))
+    else:
+        y = np.zeros(len(t))
+    return y.astype(np.float32)
+
+SIGNALS = ("sweep", "vibrato", "noise", "silence")
+
+# ==== TIMING ====
+def median_time(func, repeats):
+    func()  # Warm-up (imports, allocations, JIT caches)
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+def aubio_track(y, sample_rate, buffer_size=BUFFER_SIZE):
+    # aubio's YIN hop by hop, for comparison with yin.py
+    pitch_o = aubio.pitch("yin", buffer_size, buffer_size, sample_rate)
+    hops = y[:len(y) // buffer_size * buffer_size].reshape(-1, buffer_size)
+    return np.array([pitch_o(hop)[0] for hop in hops])
+
+def bench_pitch(repeats):
+    results = {}
+    for sample_rate in SAMPLE_RATES:
+        for kind in SIGNALS:
+            y = make_signal(kind, sample_rate)
+            seconds = len(y) / sample_rate
+            # Full offline path: YIN per hop plus the smoothing filters
+            t = median_time(lambda: pitch_track(y, sample_rate), repeats)
+            results[f"pitch/track/{kind}/{sample_rate}"] = t / seconds
+            t = median_time(lambda: aubio_track(y, sample_rate), repeats)
+            results[f"pitch/aubio/{kind}/{sample_rate}"] = t / seconds
+            # Same frames and search range for the in-project engine and librosa
+            t = median_time(lambda: yin_signal(y, sample_rate, fmin=65.4, fmax=2093.0), repeats)
+            results[f"pitch/yin/{kind}/{sample_rate}"] = t / seconds
+            t = median_time(lambda: librosa.yin(y, fmin=65.4, fmax=2093.0, sr=sample_rate), repeats)
+            results[f"pitch/librosa/{kind}/{sample_rate}"] = t / seconds
+    return results
+
+def bench_dtw(repeats):
+    results = {}
+    rng = np.random.default_rng(SEED)
+    # Piecewise-constant melody with a little jitter, like a YIN contour
+    notes = rng.uniform(110, 440, DTW_REFERENCE_FRAMES // 20 + 1)
+    ref = np.repeat(notes, 20)[:DTW_REFERENCE_FRAMES] + rng.normal(0, 2, DTW_REFERENCE_FRAMES)
+    for chunk in DTW_CHUNK_FRAMES:
+        scorer = StreamingDTW(ref)
+        start = 0
+        def step():
+            nonlocal start
+            user = ref[start:start + chunk] * 1.01
+            scorer.update(user)
+            start = (start + chunk) % (len(ref) - chunk)
+        results[f"dtw/chunk_{chunk}"] = median_time(step, repeats * 5)
+    return results
+
+# ==== RENDERING ====
+class StaticPitch:
+    # Stands in for the microphone so frames can be rendered headless
+    def __init__(self, pitch=220.0):
+        self.pitch = pitch
+        self.detectors = [self]
+    def get_smoothed_pitch(self, until=None):
+        return self.pitch
+    def analysed_until(self):
+        return float("inf")
+    def start_recording(self):
+        pass
+    def stop_recording(self):
+        pass
+    def cleanup(self):
+        pass
+
+def bench_render(repeats):
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    import game
+    from timeline import LyricTimeline
+
+    results = {}
+    for count in LYRIC_COUNTS:
+        duration = 180.0
+        lyrics = [(i * duration / count, f"Lyric line {i}", 110 * 2 ** ((i % 24) / 12)) for i in range(count)]
+        karaoke = game.KaraokeGame(stats_path=None, capture=StaticPitch())
+        karaoke.devices_ready()
+        song = game.Song("Benchmark", "", lyrics)
+        song.duration = duration
+        song.timeline = LyricTimeline(lyrics, duration)
+        karaoke.current_song = song
+        karaoke.game_state = "playing"
+        karaoke.playback = SteppedClock()
+
+        def frames(advance):
+            for i in range(RENDER_FRAMES):
+                if advance:
+                    karaoke.playback.step(1 / 60)
+                karaoke.update()
+                karaoke.draw()
+        results[f"render/moving/lyrics_{count}"] = median_time(lambda: frames(True), repeats) / RENDER_FRAMES
+        results[f"render/static/lyrics_{count}"] = median_time(lambda: frames(False), repeats) / RENDER_FRAMES
+    return results
+
+class SteppedClock:
+    # Song clock that advances one frame per step instead of in real time
+    def __init__(self):
+        self.time = 0.0
+    def step(self, seconds):
+        self.time += seconds
+    def position(self):
+        return self.time
+    def capture_time_for(self, song_time):
+        return song_time
+
+SUITES = {"pitch": bench_pitch, "dtw": bench_dtw, "render": bench_render}
+
+# ==== COMPARISON ====
+def compare(results, baseline, threshold):
+    regressions = []
+    for name, value in sorted(results.items()):
+        base = baseline.get(name)
+        if not base:
+            print(f"  {name:<40} {value * 1000:10.4f} ms  (new)")
+            continue
+        change = value / base - 1
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"  {name:<40} {value * 1000:10.4f} ms  {change:+7.1%}{flag}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the karaoke benchmark suite")
+    parser.add_argument("suites", nargs="*", default=list(SUITES), help=f"Subset of {', '.join(SUITES)}")
+    parser.add_argument("-o", "--output", default="bench_results.json", help="Where to save results")
+    parser.add_argument("--compare", help="Baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Allowed slowdown before a result is flagged (0.10 = 10%%)")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    results = {}
+    for name in args.suites:
+        print(f"Running {name} benchmarks...")
+        results.update(SUITES[name](args.repeats))
+
+    with open(args.output, "w") as f:
+        json.dump({
+            "meta": {
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "numpy": np.__version__,
+                "librosa": librosa.__version__,
+                "aubio": getattr(aubio, "version", ""),
+                "time": time.time(),
+            },
+            "results": results,
+        }, f, indent=1)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) over {args.threshold:.0%}")
+            sys.exit(1)
+    else:
+        for name, value in sorted(results.items()):
+            print(f"  {name:<40} {value * 1000:10.4f} ms")
+
+if __name__ == "__main__":
+    main()
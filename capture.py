@@ -0,0 +1,186 @@
+import abc
+import os
+import threading
+import time
+
+import numpy as np
+
+# ==== SETTINGS ====
+BLOCK_SIZE = 256                       # Frames per callback (~6 ms at 44.1 kHz)
+LATENCY = "low"                        # PortAudio latency hint for device input
+INPUT = os.environ.get("KARAOKE_INPUT", "device")  # Default source, see open_source()
+
+# Audio capture sources.
+#
+# Every source delivers float32 blocks of shape (frames, channels) to the
+# sinks registered with add_sink(), calling each as sink(block, captured_at)
+# where captured_at is the perf_counter time at which the last frame of the
+# block was captured.  Blocks are only valid during the call; sinks copy what
+# they keep.  Sinks run on the source's thread (the PortAudio callback for a
+# device), so they must not block unless the source is not real-time.
+#
+#   DeviceSource - callback-driven input stream on a sound card
+#   FileSource   - replays a WAV file or array, in real time or as fast as
+#                  the sinks take it, so the whole pipeline runs headless
+#
+# Block size and latency are set here once for the game, the streaming
+# scorer and the mic test.
+class CaptureSource(abc.ABC):
+    realtime = True
+
+    def __init__(self, channels, sample_rate, block_size=BLOCK_SIZE):
+        self.channels = channels
+        self.sample_rate = sample_rate
+        self.block_size = block_size
+        self._sinks = []
+
+    # Sinks are swapped in as a new list, so the capture thread can keep
+    # iterating the old one without a lock
+    def add_sink(self, sink):
+        self._sinks = self._sinks + [sink]
+
+    def remove_sink(self, sink):
+        self._sinks = [s for s in self._sinks if s is not sink]
+
+    def _deliver(self, block, captured_at):
+        for sink in self._sinks:
+            sink(block, captured_at)
+
+    @property
+    def input_latency(self):
+        return 0.0
+
+    @abc.abstractmethod
+    def start(self):
+        # Begin delivering blocks to the sinks
+        pass
+
+    @abc.abstractmethod
+    def stop(self):
+        # Stop delivering; start() may be called again
+        pass
+
+    def close(self):
+        pass
+
+class DeviceSource(CaptureSource):
+    def __init__(self, channels=1, sample_rate=44100, block_size=BLOCK_SIZE, device=None, latency=LATENCY):
+        super().__init__(channels, sample_rate, block_size)
+        # Imported here so file sources work on machines without PortAudio
+        import sounddevice as sd
+        self.stream = sd.InputStream(
+            device=device,
+            channels=channels,
+            samplerate=sample_rate,
+            blocksize=block_size,
+            latency=latency,
+            dtype="float32",
+            callback=self._callback,
+        )
+
+    def _callback(self, indata, frames, time_info, status):
+        self._deliver(indata, time.perf_counter())
+
+    @property
+    def input_latency(self):
+        return self.stream.latency
+
+    def start(self):
+        self.stream.start()
+
+    def stop(self):
+        self.stream.stop()
+
+    def close(self):
+        self.stream.close()
+
+class FileSource(CaptureSource):
+    # speed=1.0 replays in real time; speed=None delivers blocks as fast as
+    # the sinks accept them (sinks may block for backpressure).  With
+    # loop=False `finished` is set once the last block has been delivered.
+    def __init__(self, samples, sample_rate, block_size=BLOCK_SIZE, speed=1.0, loop=True):
+        samples = np.asarray(samples, dtype=np.float32)
+        if samples.ndim == 1:
+            samples = samples[:, np.newaxis]
+        super().__init__(samples.shape[1], sample_rate, block_size)
+        self.samples = samples
+        self.speed = speed
+        self.realtime = speed is not None
+        self.loop = loop
+        self.finished = threading.Event()
+        self.started_at = None         # perf_counter time of the first frame
+        self._running = False
+        self._thread = None
+
+    @classmethod
+    def from_wav(cls, path, sample_rate=None, block_size=BLOCK_SIZE, speed=1.0, loop=True):
+        # Resampled to `sample_rate` if given, so it can stand in for a device
+        from scoring import load_wav
+        samples, file_rate = load_wav(path, mono=False)
+        if sample_rate and sample_rate != file_rate:
+            from scipy.signal import resample_poly
+            g = np.gcd(sample_rate, file_rate)
+            samples = resample_poly(samples, sample_rate // g, file_rate // g, axis=0)
+        else:
+            sample_rate = file_rate
+        return cls(samples, sample_rate, block_size, speed, loop)
+
+    def start(self):
+        self.finished.clear()
+        self.started_at = time.perf_counter()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+
+    def _run(self):
+        total = len(self.samples)
+        start = self.started_at
+        sent = 0                       # Frames delivered since start()
+        pos = 0                        # Position in the file
+        while self._running:
+            n = min(self.block_size, total - pos)
+            if n <= 0:
+                if not self.loop or total == 0:
+                    break
+                pos = 0
+                continue
+            block = self.samples[pos:pos + n]
+            pos += n
+            sent += n
+            # Timestamps follow the file, so an unlimited-speed replay scores
+            # exactly like a real-time one
+            if self.realtime:
+                captured_at = start + sent / (self.sample_rate * self.speed)
+                delay = captured_at - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            else:
+                captured_at = start + sent / self.sample_rate
+            self._deliver(block, captured_at)
+        self._running = False
+        self.finished.set()
+
+def synthetic_signal(frequencies, seconds, sample_rate, amplitude=0.5):
+    # One sine channel per frequency (0 gives silence), shape (frames, channels)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    freqs = np.asarray(frequencies, dtype=np.float64)
+    return (amplitude * np.sin(2 * np.pi * t[:, np.newaxis] * freqs)).astype(np.float32)
+
+def open_source(spec=INPUT, channels=1, sample_rate=44100, block_size=BLOCK_SIZE, speed=1.0):
+    # "device" or "device:<name or index>" - sound card input
+    # "synth:220,440"                      - sine channels at these frequencies
+    # anything else                        - path of a WAV file to replay
+    kind, _, arg = spec.partition(":")
+    if kind == "device":
+        device = int(arg) if arg.isdigit() else (arg or None)
+        return DeviceSource(channels, sample_rate, block_size, device=device)
+    if kind == "synth":
+        freqs = [float(f) for f in arg.split(",")] if arg else [220.0]
+        freqs = (freqs * channels)[:max(channels, len(freqs))]
+        return FileSource(synthetic_signal(freqs, 10.0, sample_rate), sample_rate, block_size, speed)
+    return FileSource.from_wav(spec, sample_rate, block_size, speed)
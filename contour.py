@@ -0,0 +1,79 @@
+import math
+
+import numpy as np
+
+# ==== SETTINGS ====
+FRAME_RATE = 100.0                     # Contour frames per second for lyric-derived contours
+NOTE_SCORES = np.array([100, 75, 50, 25, 10])  # Score per whole semitone of error, last entry caps
+
+# Reference pitch in MIDI note numbers and the scoring rule shared by every
+# scorer.
+#
+# Scoring works on semitone error, so it behaves the same in every register:
+# an error of one semitone costs as much for a bass as for a soprano.
+# Scoring a frame or a note is a subtraction and a table lookup; unvoiced
+# frames and rests are NaN.  The game and the batch scorer score per lyric
+# (LyricTimeline.midi); the streaming scorer in audio.py aligns against a
+# ReferenceContour, the reference sampled at a fixed frame rate from the
+# lyric table (a step function of the lyric pitches) or the reference
+# audio's YIN track.
+
+# ==== SCORING RULE ====
+def hz_to_midi(hz):
+    # MIDI note numbers for a scalar or array of Hz; NaN where hz <= 0
+    hz = np.asarray(hz, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(hz > 0, 12 * np.log2(hz / 440) + 69, np.nan)
+
+def semitone_scores(error):
+    # NOTE_SCORES entry for each absolute semitone error; -1 where NaN
+    error = np.abs(np.asarray(error, dtype=np.float64))
+    scored = ~np.isnan(error)
+    buckets = np.minimum(np.floor(np.where(scored, error, 0)), len(NOTE_SCORES) - 1).astype(int)
+    return np.where(scored, NOTE_SCORES[buckets], -1)
+
+def score_midi(expected, sung):
+    # Vectorised score of sung against expected MIDI pitches; -1 where either is NaN
+    return semitone_scores(np.asarray(expected, dtype=np.float64) - sung)
+
+def note_score_midi(expected, sung):
+    # Scalar score_midi(), or None if the note is not scored (rest or silence)
+    error = abs(expected - sung)
+    if math.isnan(error):
+        return None
+    return int(NOTE_SCORES[min(int(error), len(NOTE_SCORES) - 1)])
+
+# ==== CONTOUR ====
+class ReferenceContour:
+    def __init__(self, midi, frame_rate=FRAME_RATE):
+        self.midi = np.asarray(midi, dtype=np.float32)
+        self.frame_rate = frame_rate
+
+    def __len__(self):
+        return len(self.midi)
+
+    @classmethod
+    def from_lyrics(cls, lyrics_data, duration=0, frame_rate=FRAME_RATE):
+        # Each frame holds the pitch of the lyric active at its start time
+        times = np.array([entry[0] for entry in lyrics_data], dtype=np.float64)
+        order = np.argsort(times, kind="stable")
+        note_midi = hz_to_midi([lyrics_data[i][2] for i in order])
+        if duration <= 0:
+            duration = times.max() + 1 if len(times) else 0
+        frame_times = np.arange(int(np.ceil(duration * frame_rate))) / frame_rate
+        index = np.searchsorted(times[order], frame_times, side="right") - 1
+        midi = np.full(len(frame_times), np.nan)
+        voiced = index >= 0
+        midi[voiced] = note_midi[index[voiced]]
+        return cls(midi, frame_rate)
+
+    def filled(self):
+        # The contour with rests replaced by the nearest earlier (or, at the
+        # start, later) voiced pitch, for aligners that need finite values
+        voiced = ~np.isnan(self.midi)
+        if not voiced.any():
+            return np.zeros(len(self.midi), dtype=np.float32)
+        index = np.where(voiced, np.arange(len(self.midi)), 0)
+        np.maximum.accumulate(index, out=index)
+        index[:np.argmax(voiced)] = np.argmax(voiced)
+        return self.midi[index]
@@ -0,0 +1,73 @@
+import numpy as np
+
+# ==== SETTINGS ====
+DEFAULT_RADIUS = 100                   # Reference frames searched either side of the current position
+
+# Online subsequence DTW against a fixed reference sequence.
+#
+# Instead of building a full cost matrix for every chunk, only one row of the
+# accumulated-cost matrix is kept, restricted to a band of 2 * radius + 1
+# reference frames around the current best match.  Each user frame advances
+# that row by one step, so a chunk of n frames costs O(n * band) and memory
+# does not grow with the length of the song.
+#
+# The band is re-centred on the cheapest reference frame after every step,
+# which is how the scorer follows the singer through the song.  Accumulated
+# costs are re-based to zero each step so they cannot grow without bound;
+# the amount removed is what `update` reports as the cost of the chunk.
+class StreamingDTW:
+    def __init__(self, ref, radius=DEFAULT_RADIUS):
+        self.ref = np.asarray(ref, dtype=np.float64)
+        self.radius = radius
+        self.reset()
+
+    def reset(self, position=0):
+        self.position = position       # Best-matching reference frame so far
+        self.frames = 0                # User frames consumed
+        self._row = None               # Accumulated cost over [_lo, _lo + len(_row))
+        self._lo = 0
+
+    def _window(self):
+        lo = max(0, self.position - self.radius)
+        hi = min(len(self.ref), self.position + self.radius + 1)
+        return lo, hi
+
+    def _step(self, x):
+        lo, hi = self._window()
+        cost = np.abs(self.ref[lo:hi] - x)
+
+        if self._row is None:
+            # Subsequence DTW: the path may start anywhere inside the band
+            row = cost
+        else:
+            # Previous row shifted into the new window, with one extra cell
+            # on the left for the diagonal predecessor of the first column
+            prev = np.full(hi - lo + 1, np.inf)
+            src_lo = max(lo - 1, self._lo)
+            src_hi = min(hi, self._lo + len(self._row))
+            if src_lo < src_hi:
+                prev[src_lo - (lo - 1):src_hi - (lo - 1)] = self._row[src_lo - self._lo:src_hi - self._lo]
+            # Vertical and diagonal predecessors
+            best_prev = np.minimum(prev[1:], prev[:-1])
+            # Horizontal moves within the row: D[j] = c[j] + min(best_prev[j], D[j-1])
+            # unrolls to D[j] = C[j] + min_{k<=j}(best_prev[k] - C[k-1]), a prefix minimum
+            csum = np.cumsum(cost)
+            shifted = np.concatenate(([0.0], csum[:-1]))
+            row = csum + np.minimum.accumulate(best_prev - shifted)
+
+        best = int(np.argmin(row))
+        step_cost = row[best]
+        self._row = row - step_cost
+        self._lo = lo
+        self.position = lo + best
+        self.frames += 1
+        return step_cost
+
+    def update(self, user):
+        # Feed a chunk of user pitch frames; returns the alignment cost it added
+        if len(self.ref) == 0:
+            return 0.0
+        total = 0.0
+        for x in np.asarray(user, dtype=np.float64).ravel():
+            total += self._step(x)
+        return total
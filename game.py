@@ -1,22 +1,56 @@
 import pygame
 import pygame.mixer
 import numpy as np
-import pyaudio
 import wave
 import threading
 import time
-import aubio
 import math
-from queue import Queue
+import os
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from capture import INPUT, FileSource
+from contour import hz_to_midi, note_score_midi
+from instrumentation import Instrumentation
+from leaderboard import ADDRESS as LEADERBOARD_ADDRESS, LeaderboardClient
+from library import SONGS_DIR, CatalogSongs, Library, rescan
+from multi_capture import MAX_SINGERS, MultiSingerCapture
+from pitch_filters import DEFAULT_FILTERS, FILTERS
+from session import SESSIONS_DIR, ReplayClock, Session, SessionRecorder
+from playback_clock import PlaybackClock, mixer_output_latency
+from song_loader import SongPreloader, metadata_cache
+from stage_output import StageOutput
+from songs import example_lyrics
+from timeline import LyricTimeline
+from render_cache import FrameRenderer, TextCache
+from ring_buffer import HistoryBuffer
 
-# Initialize pygame
-pygame.init()
-pygame.mixer.init()
+MIXER_BUFFER = 1024  # Samples per mixer buffer; part of the output latency
+
+# Give up waiting for pitch analysis of a note after this many seconds
+ANALYSIS_TIMEOUT = 0.5
+
+# Songs listed per menu page (selected with keys 1-9)
+SONGS_PER_PAGE = 9
+
+# Best scores of the day shown on the results screen
+LEADERBOARD_ROWS = 5
+
+# Notes of sung/expected pitch kept for the scrolling guide
+PITCH_HISTORY_SIZE = 4096
+
+# Log-frequency scale shared by the pitch meter and the pitch guide
+MIN_PITCH = 50     # Hz
+MAX_PITCH = 1000   # Hz
+
+def pitch_to_unit(pitch):
+    # 0..1 position of `pitch` (scalar or array) on the scale, NaN for silence
+    pitch = np.asarray(pitch, dtype=np.float64)
+    clamped = np.clip(pitch, MIN_PITCH, MAX_PITCH)
+    unit = (np.log10(clamped) - math.log10(MIN_PITCH)) / (math.log10(MAX_PITCH) - math.log10(MIN_PITCH))
+    return np.where(pitch > 0, unit, np.nan)
 
 # Screen setup
 WIDTH, HEIGHT = 800, 600
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("Pygame Karaoke")
 
 # Colors
 WHITE = (255, 255, 255)
@@ -26,10 +60,42 @@ GREEN = (0, 255, 0)
 BLUE = (0, 0, 255)
 YELLOW = (255, 255, 0)
 
-# Fonts
-font_large = pygame.font.SysFont("Arial", 48)
-font_medium = pygame.font.SysFont("Arial", 36)
-font_small = pygame.font.SysFont("Arial", 24)
+# Pitch marker and guide line colour of each singer in multi-singer mode
+SINGER_COLORS = [RED, BLUE, YELLOW, (255, 0, 255), (0, 255, 255), (255, 128, 0), WHITE, (128, 255, 128)]
+
+# ==== STARTUP ====
+# Importing this module opens nothing.  init_display() creates the window,
+# fonts and renderer the first time something is drawn, and init_mixer()
+# opens the output device; the game runs the mixer and the capture devices
+# on a background thread so the menu is on screen while they start.
+screen = None
+font_large = font_medium = font_small = font_stats = None
+renderer = None
+
+# Text surfaces are cached and frames are drawn through a dirty-rect renderer
+text_cache = TextCache()
+_init_lock = threading.Lock()
+
+def init_display():
+    global screen, font_large, font_medium, font_small, font_stats, renderer
+    if screen is not None:
+        return
+    pygame.display.init()
+    pygame.font.init()
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption("Pygame Karaoke")
+    font_large = pygame.font.SysFont("Arial", 48)
+    font_medium = pygame.font.SysFont("Arial", 36)
+    font_small = pygame.font.SysFont("Arial", 24)
+    font_stats = pygame.font.SysFont("Courier", 14)
+    renderer = FrameRenderer(screen, BLACK)
+
+def init_mixer():
+    # Safe to call from any thread, e.g. the song preloader
+    with _init_lock:
+        if not pygame.mixer.get_init():
+            pygame.mixer.pre_init(buffer=MIXER_BUFFER)
+            pygame.mixer.init()
 
 # Button class for UI elements
 class Button:
@@ -43,13 +109,13 @@ class Button:
     def draw(self):
         # Draw button
         color = self.hover_color if self.is_hovered else self.color
-        pygame.draw.rect(screen, color, self.rect)
-        pygame.draw.rect(screen, WHITE, self.rect, 2)  # White border
+        renderer.rect(color, self.rect)
+        renderer.rect(WHITE, self.rect, 2)  # White border
         
         # Draw text
-        text_surf = font_medium.render(self.text, True, WHITE)
+        text_surf = text_cache.render(font_medium, self.text, WHITE)
         text_rect = text_surf.get_rect(center=self.rect.center)
-        screen.blit(text_surf, text_rect)
+        renderer.blit(text_surf, text_rect)
         
     def check_hover(self, mouse_pos):
         self.is_hovered = self.rect.collidepoint(mouse_pos)
@@ -59,133 +125,200 @@ class Button:
         return self.rect.collidepoint(mouse_pos) and mouse_clicked
 
 class Song:
-    def __init__(self, title, audio_file, lyrics_data):
+    def __init__(self, title, audio_file, lyrics_data, duration=0):
         self.title = title
         self.audio_file = audio_file
         self.lyrics_data = lyrics_data  # List of (timestamp, lyric, pitch) tuples
-        self.duration = 0  # Will be set when loading
+        self.duration = duration  # Will be set when loading if not known yet
+        self.timeline = None
 
-    def load(self):
-        pygame.mixer.music.load(self.audio_file)
-        # Get duration (this is a simplified approach)
-        sound = pygame.mixer.Sound(self.audio_file)
-        self.duration = sound.get_length()
-
-class PitchDetector:
-    def __init__(self, sample_rate=44100, buffer_size=1024):
-        self.sample_rate = sample_rate
-        self.buffer_size = buffer_size
-        
-        # Audio input setup
-        self.p = pyaudio.PyAudio()
-        self.stream = self.p.open(
-            format=pyaudio.paFloat32,
-            channels=1,
-            rate=self.sample_rate,
-            input=True,
-            frames_per_buffer=self.buffer_size
-        )
-        
-        # Pitch detection with aubio
-        self.pitch_o = aubio.pitch("yin", self.buffer_size, self.buffer_size, self.sample_rate)
-        self.pitch_o.set_unit("Hz")
-        self.pitch_o.set_silence(-40)
-        
-        self.pitch_history = []
-        self.is_recording = False
-        self.audio_queue = Queue()
-        
-    def start_recording(self):
-        self.is_recording = True
-        self.recording_thread = threading.Thread(target=self._record)
-        self.recording_thread.daemon = True
-        self.recording_thread.start()
-        
-    def stop_recording(self):
-        self.is_recording = False
-        if hasattr(self, 'recording_thread'):
-            self.recording_thread.join(timeout=1)
-        
-    def _record(self):
-        while self.is_recording:
+    def prepare(self):
+        # Duration and timeline, without decoding the audio; safe to call
+        # from the preloader thread
+        if self.timeline is not None:
+            return
+        if not self.duration:
             try:
-                audio_data = self.stream.read(self.buffer_size, exception_on_overflow=False)
-                self.audio_queue.put(audio_data)
-            except Exception as e:
-                print(f"Error recording audio: {e}")
-                break
-    
-    def get_current_pitch(self):
-        if self.audio_queue.empty():
-            return 0
-            
-        audio_data = self.audio_queue.get()
-        signal = np.frombuffer(audio_data, dtype=np.float32)
+                self.duration = metadata_cache.get(self.audio_file)["duration"]
+            except (OSError, ValueError) as e:
+                # Unknown format or broken header: fall back to a full decode
+                print(f"Could not read duration of {self.audio_file} from its header: {e}")
+                init_mixer()
+                self.duration = pygame.mixer.Sound(self.audio_file).get_length()
+        self.timeline = LyricTimeline(self.lyrics_data, self.duration)
+
+    def load(self, preloaded=None):
+        self.prepare()
+        if preloaded is not None:
+            # Stream from the contents the preloader already read into memory
+            pygame.mixer.music.load(preloaded, os.path.splitext(self.audio_file)[1][1:])
+        else:
+            pygame.mixer.music.load(self.audio_file)
+
+# Score and sung-pitch history of one singer
+class Singer:
+    def __init__(self, detector, name, color):
+        self.detector = detector
+        self.name = name
+        self.color = color
+        self.score = 0
+        self.max_score = 0
+        # Sung pitch per scored note, bounded for endless loop mode
+        self.pitch_history = HistoryBuffer(PITCH_HISTORY_SIZE)
         
-        pitch = self.pitch_o(signal)[0]
-        confidence = self.pitch_o.get_confidence()
+    def reset(self):
+        self.score = 0
+        self.max_score = 0
+        self.pitch_history.clear()
         
-        if confidence < 0.8:  # Adjust this threshold as needed
-            pitch = 0
-            
-        self.pitch_history.append(pitch)
-        if len(self.pitch_history) > 10:  # Keep only recent history
-            self.pitch_history.pop(0)
-            
-        return pitch
+    def percent(self):
+        if self.max_score > 0:
+            return (self.score / self.max_score) * 100
+        return 0
 
-    def get_smoothed_pitch(self):
-        if not self.pitch_history:
-            return 0
-        # Filter out zeros and calculate average
-        valid_pitches = [p for p in self.pitch_history if p > 0]
-        if not valid_pitches:
-            return 0
-        return sum(valid_pitches) / len(valid_pitches)
-        
-    def cleanup(self):
-        self.stream.stop_stream()
-        self.stream.close()
-        self.p.terminate()
+def grade_for(score_percent):
+    if score_percent >= 95:
+        return "S"
+    elif score_percent >= 90:
+        return "A+"
+    elif score_percent >= 80:
+        return "A"
+    elif score_percent >= 70:
+        return "B"
+    elif score_percent >= 60:
+        return "C"
+    elif score_percent >= 50:
+        return "D"
+    return "F"
 
 class KaraokeGame:
-    def __init__(self):
+    def __init__(self, stats_path="karaoke_stats.json", capture=None, guide_points=100, sessions_dir=None,
+                 open_capture=None, stage=None, leaderboard=None, names=()):
         self.songs = []
         self.current_song = None
         self.game_state = "menu"  # menu, playing, results
-        self.score = 0
-        self.max_score = 0
         self.current_lyric_index = 0
-        self.pitch_detector = PitchDetector()
-        self.pitch_history = []
-        self.expected_pitch_history = []
+        self.notes_scored = 0
+        # One capture source (a single microphone by default) feeding one
+        # analyser per singer; every singer is scored on every note.  Unless
+        # a capture is given, open_capture() opens it on the startup thread
+        # together with the mixer (see devices_ready())
+        self.capture = None
+        self.singers = []
+        self.names = list(names)  # Singer names, P1, P2, ... for the rest
+        open_capture = open_capture or (lambda: MultiSingerCapture.open(INPUT))
+        self._startup = ThreadPoolExecutor(max_workers=1)
+        self._mixer_ready = self._startup.submit(init_mixer)
+        self._capture_ready = self._startup.submit(lambda: capture or open_capture())
+        # Expected pitch per scored note, shared by all singers
+        self.expected_pitch_history = HistoryBuffer(PITCH_HISTORY_SIZE)
+        self.guide_points = guide_points
+        self._guide_cache = (None, [], [])
         self.clock = pygame.time.Clock()
+        self.preloader = SongPreloader(lambda song: song.prepare())
+        
+        # Menu paging and title search over the song list
+        self.menu_items = []
+        self.menu_page = 0
+        self.search_query = ""
+        self.search_active = False
+        self.pending_library = None  # Set by a background catalog rescan
+        
+        # Frame and audio timing; F3 toggles the overlay
+        self.instrumentation = Instrumentation()
+        self.show_stats = False
+        self.stats_path = stats_path
+        self.stats_lines = []
+        self.stats_refresh = 0
         
         # Create stop button
         self.stop_button = Button(WIDTH - 120, 20, 100, 40, "STOP", RED, (255, 100, 100))
         
+        # Song position comes from the mixer, corrected for device latency
+        # (filled in once the devices are open)
+        self.playback = PlaybackClock()
+        
         # Track loop status and time
         self.is_looping = True
         self.loop_counter = 0
         self.loop_time = 0
         
+        # Optional recording of each performance (see session.py); when
+        # replaying one, the backing track stays silent and the game ends
+        # with the recording
+        self.sessions_dir = sessions_dir
+        self.recorder = None
+        self.finished_recorders = []
+        self.play_music = True
+        self.session_end = None
+        
+        # Optional venue hardware (see stage_output.py), fed the meter and
+        # score values once per frame
+        self.stage = stage
+        
+        # Optional shared leaderboard (see leaderboard.py): final scores are
+        # submitted without waiting, and the day's best for the song are
+        # fetched on the startup thread for the results screen
+        self.leaderboard = leaderboard
+        self.leaderboard_top = None
+        
+    def devices_ready(self, wait=True):
+        # Take over the mixer and capture from the startup thread; with
+        # wait=False only if they are already open
+        if self.capture is not None:
+            return True
+        if not wait and not self._capture_ready.done():
+            return False
+        self._mixer_ready.result()
+        self.capture = self._capture_ready.result()
+        self.singers = [Singer(detector, self.names[i] if i < len(self.names) else f"P{i + 1}",
+                               SINGER_COLORS[i % len(SINGER_COLORS)])
+                        for i, detector in enumerate(self.capture.detectors)]
+        self.playback.output_latency = mixer_output_latency(MIXER_BUFFER)
+        self.playback.input_latency = getattr(self.capture, "input_latency", 0.0)
+        return True
+        
     def add_song(self, song):
         self.songs.append(song)
+        self._update_menu_items()
+        
+    def use_library(self, library):
+        # Take the song list from an on-disk catalog instead of add_song()
+        self.songs = CatalogSongs(library, song_from_catalog)
+        self.current_song = None
+        self._update_menu_items()
+        
+    def _update_menu_items(self):
+        # Song indices matching the search, shown SONGS_PER_PAGE at a time
+        query = self.search_query.lower()
+        if hasattr(self.songs, "search"):
+            self.menu_items = self.songs.search(query)
+        else:
+            self.menu_items = [i for i, song in enumerate(self.songs) if query in song.title.lower()]
+        self.menu_page = 0
+        
+    def _menu_pages(self):
+        return max(1, (len(self.menu_items) + SONGS_PER_PAGE - 1) // SONGS_PER_PAGE)
         
     def select_song(self, index):
         if 0 <= index < len(self.songs):
             self.current_song = self.songs[index]
-            self.current_song.load()
+            self._mixer_ready.result()
+            self.current_song.load(self.preloader.take(self.current_song))
+            # Get the following song ready in case it is picked next
+            self.preloader.request(self.songs[(index + 1) % len(self.songs)])
             
     def start_game(self):
         if self.current_song:
+            self.devices_ready()
             self.game_state = "playing"
-            self.score = 0
-            self.max_score = 0
             self.current_lyric_index = 0
-            self.pitch_history = []
-            self.expected_pitch_history = []
-            self.start_time = time.time()
+            self.notes_scored = 0
+            self.leaderboard_top = None
+            for singer in self.singers:
+                singer.reset()
+            self.expected_pitch_history.clear()
+            self._guide_cache = (None, [], [])
             
             # Set music to loop infinitely
             self.is_looping = True
@@ -193,77 +326,101 @@ class KaraokeGame:
             self.loop_time = 0
             
             # Start playing with loop enabled (-1 means infinite loops)
-            pygame.mixer.music.play(-1)
-            self.pitch_detector.start_recording()
+            if self.play_music:
+                pygame.mixer.music.play(-1)
+            self.playback.start()
+            if self.sessions_dir:
+                self.recorder = SessionRecorder.start(self.capture, self.current_song,
+                                                      self.playback.capture_time_for(0.0), self.sessions_dir)
+            self.capture.start_recording()
             
     def stop_game(self):
         pygame.mixer.music.stop()
-        self.pitch_detector.stop_recording()
+        self.playback.stop()
+        self.capture.stop_recording()
+        if self.recorder is not None:
+            self.recorder.finish()
+            self.finished_recorders.append(self.recorder)
+            self.recorder = None
         self.is_looping = False
         self.game_state = "results"
+        if self.leaderboard is not None:
+            self._submit_results()
+            
+    def _submit_results(self):
+        records = [self.leaderboard.submit(self.current_song.title, singer.name, singer.percent(),
+                                           grade_for(singer.percent()), singer.max_score // 100)
+                   for singer in self.singers if singer.max_score > 0]
+        self.leaderboard_top = self._startup.submit(self._fetch_top, self.current_song.title, records)
+        
+    def _fetch_top(self, title, records):
+        # Today's best for the song, including this game's results even if
+        # the service has not stored them yet (or cannot be reached)
+        try:
+            rows = self.leaderboard.top(title, "today", LEADERBOARD_ROWS)
+        except (OSError, ValueError):
+            rows = []
+        ids = {row["id"] for row in rows}
+        rows += [record for record in records if record["id"] not in ids]
+        rows.sort(key=lambda row: -row["score"])
+        mine = {record["id"] for record in records}
+        return [(row, row["id"] in mine) for row in rows[:LEADERBOARD_ROWS]]
             
     def update(self):
-        if self.game_state == "playing":
-            # Calculate the current time position within the song, accounting for loops
-            current_total_time = time.time() - self.start_time
+        ready = self.devices_ready(wait=False)
+        if self.pending_library is not None and self.game_state == "menu":
+            self.use_library(self.pending_library)
+            self.pending_library = None
+        # Start with the first song selected once the mixer can load it,
+        # rather than blocking the window until the devices are open
+        if ready and self.current_song is None and self.game_state == "menu" and len(self.songs):
+            self.select_song(0)
             
-            # Check if we've looped
-            if self.current_song.duration > 0:  # Avoid division by zero
-                self.loop_counter = int(current_total_time / self.current_song.duration)
-                self.loop_time = current_total_time % self.current_song.duration
-            else:
-                self.loop_time = current_total_time
+        if self.game_state == "playing":
+            timeline = self.current_song.timeline
             
-            # This is the time position within the current loop
-            current_time = self.loop_time
+            # Calculate the current time position within the song, accounting for loops
+            current_total_time = self.playback.position()
+            if self.session_end is not None and current_total_time >= self.session_end:
+                self.stop_game()
+                return
+            self.loop_counter, self.loop_time = timeline.wrap(current_total_time)
             
-            # If we looped, reset the lyric index to start
-            if self.loop_counter > 0 and current_time < 0.1:  # Small threshold to detect start of loop
-                self.current_lyric_index = 0
-                
-            # Update current lyric
-            while (self.current_lyric_index < len(self.current_song.lyrics_data) and 
-                   current_time >= self.current_song.lyrics_data[self.current_lyric_index][0]):
+            # Score every note whose start we passed since the last update,
+            # including any that wrapped around the end of the song
+            notes_reached = timeline.notes_reached(current_total_time)
+            while self.notes_scored < notes_reached:
+                note_time = timeline.note_time(self.notes_scored)
                 
-                # Process current lyric
-                _, _, expected_pitch = self.current_song.lyrics_data[self.current_lyric_index]
-                current_pitch = self.pitch_detector.get_smoothed_pitch()
+                # Judge the pitch that was sung when the note started, which
+                # is only known once analysis has caught up with that moment
+                captured_at = self.playback.capture_time_for(note_time)
+                caught_up = all(singer.detector.analysed_until() >= captured_at for singer in self.singers)
+                if not caught_up and current_total_time - note_time < ANALYSIS_TIMEOUT:
+                    break
                 
-                self.pitch_history.append(current_pitch)
+                self.current_lyric_index = timeline.note_index(self.notes_scored)
+                expected_pitch = timeline.pitches[self.current_lyric_index]
+                expected_midi = timeline.midi[self.current_lyric_index]
                 self.expected_pitch_history.append(expected_pitch)
                 
-                # Calculate score for this note
-                if expected_pitch > 0 and current_pitch > 0:
-                    # Convert Hz to musical scale for better scoring
-                    expected_note = 12 * math.log2(expected_pitch/440) + 69  # MIDI note number
-                    current_note = 12 * math.log2(current_pitch/440) + 69    # MIDI note number
+                for i, singer in enumerate(self.singers):
+                    current_pitch = singer.detector.get_smoothed_pitch(until=captured_at)
+                    singer.pitch_history.append(current_pitch)
                     
-                    # Calculate score based on how close we are (within 1 semitone is perfect)
-                    note_diff = abs(expected_note - current_note)
-                    if note_diff < 1:
-                        note_score = 100
-                    elif note_diff < 2:
-                        note_score = 75
-                    elif note_diff < 3:
-                        note_score = 50
-                    elif note_diff < 4:
-                        note_score = 25
-                    else:
-                        note_score = 10
-                        
-                    self.score += note_score
-                    self.max_score += 100
+                    # Calculate score for this note
+                    note_score = note_score_midi(expected_midi, float(hz_to_midi(current_pitch)))
+                    if note_score is not None:
+                        singer.score += note_score
+                        singer.max_score += 100
+                    if self.recorder is not None:
+                        self.recorder.note(i, note_time, self.current_lyric_index,
+                                           expected_pitch, current_pitch, note_score)
                     
-                self.current_lyric_index += 1
-                
-                # If we've reached the end of the lyrics, but music is still looping,
-                # reset the lyric index for the next loop
-                if self.current_lyric_index >= len(self.current_song.lyrics_data):
-                    self.current_lyric_index = 0
+                self.notes_scored += 1
     
     def draw(self):
-        screen.fill(BLACK)
-        
+        init_display()
         if self.game_state == "menu":
             self._draw_menu()
         elif self.game_state == "playing":
@@ -271,134 +428,131 @@ class KaraokeGame:
         elif self.game_state == "results":
             self._draw_results()
             
-        pygame.display.flip()
+        if self.show_stats:
+            self._draw_stats()
+            
+        # Only the parts of the screen that changed are repainted
+        renderer.present()
         
     def _draw_menu(self):
-        title = font_large.render("KARAOKE GAME", True, WHITE)
-        screen.blit(title, (WIDTH//2 - title.get_width()//2, 50))
-        
-        # Draw song list
-        for i, song in enumerate(self.songs):
-            color = YELLOW if self.current_song == song else WHITE
-            song_text = font_medium.render(f"{i+1}. {song.title}", True, color)
-            screen.blit(song_text, (WIDTH//2 - song_text.get_width()//2, 150 + i*50))
+        title = text_cache.render(font_large, "KARAOKE GAME", WHITE)
+        renderer.blit(title, (WIDTH//2 - title.get_width()//2, 50))
+        
+        # Draw the current page of the song list
+        first = self.menu_page * SONGS_PER_PAGE
+        for i, song_idx in enumerate(self.menu_items[first:first + SONGS_PER_PAGE]):
+            song = self.songs[song_idx]
+            selected = self.current_song is not None and song.audio_file == self.current_song.audio_file
+            color = YELLOW if selected else WHITE
+            song_text = text_cache.render(font_medium, f"{i+1}. {song.title}", color)
+            renderer.blit(song_text, (WIDTH//2 - song_text.get_width()//2, 115 + i*33))
+            
+        # Page and search status
+        page_text = text_cache.render(font_small, f"Page {self.menu_page + 1}/{self._menu_pages()}", WHITE)
+        renderer.blit(page_text, (WIDTH - 20 - page_text.get_width(), 20))
+        if self.search_active or self.search_query:
+            cursor = "_" if self.search_active else ""
+            search_text = text_cache.render(font_small, f"Search: {self.search_query}{cursor}", YELLOW)
+            renderer.blit(search_text, (20, 20))
             
         # Instructions
         instructions = [
             "Press number keys to select a song",
+            "LEFT/RIGHT to change page, / to search",
             "Press SPACE to start singing",
             "Click STOP button or press 'S' to stop",
             "Press ESC to quit"
         ]
         
         for i, instruction in enumerate(instructions):
-            text = font_small.render(instruction, True, WHITE)
-            screen.blit(text, (WIDTH//2 - text.get_width()//2, HEIGHT - 170 + i*30))
+            text = text_cache.render(font_small, instruction, WHITE)
+            renderer.blit(text, (WIDTH//2 - text.get_width()//2, HEIGHT - 170 + i*30))
     
     def _draw_game(self):
         # Draw song title
-        title = font_medium.render(self.current_song.title, True, WHITE)
-        screen.blit(title, (20, 20))
+        title = text_cache.render(font_medium, self.current_song.title, WHITE)
+        renderer.blit(title, (20, 20))
         
         # Draw loop counter
-        loop_text = font_small.render(f"Loop: {self.loop_counter + 1}", True, WHITE)
-        screen.blit(loop_text, (20, 60))
+        loop_text = text_cache.render(font_small, f"Loop: {self.loop_counter + 1}", WHITE)
+        renderer.blit(loop_text, (20, 60))
         
         # Draw current time within the loop
-        time_text = font_small.render(f"Time: {self.loop_time:.1f}s / {self.current_song.duration:.1f}s", True, WHITE)
-        screen.blit(time_text, (20, 90))
+        time_text = text_cache.render(font_small, f"Time: {self.loop_time:.1f}s / {self.current_song.duration:.1f}s", WHITE)
+        renderer.blit(time_text, (20, 90))
         
         # Draw score
-        if self.max_score > 0:
-            score_percent = (self.score / self.max_score) * 100
+        if len(self.singers) == 1:
+            score_text = text_cache.render(font_medium, f"Score: {self.singers[0].percent():.1f}%", WHITE)
+            renderer.blit(score_text, (WIDTH//2 - score_text.get_width()//2, 20))
         else:
-            score_percent = 0
-        score_text = font_medium.render(f"Score: {score_percent:.1f}%", True, WHITE)
-        screen.blit(score_text, (WIDTH//2 - score_text.get_width()//2, 20))
+            # Up to four singers per row, each in their own colour
+            for i, singer in enumerate(self.singers):
+                row, column = divmod(i, 4)
+                score_text = text_cache.render(font_small, f"{singer.name} {singer.percent():.1f}%", singer.color)
+                renderer.blit(score_text, (230 + column * 110, 20 + row * 30))
         
         # Draw stop button
         self.stop_button.draw()
         
         # Draw current and upcoming lyrics
-        current_lyric = ""
-        next_lyric = ""
-        
-        # Find current and next lyrics based on current time within the loop
-        for i in range(len(self.current_song.lyrics_data)):
-            timestamp, lyric, _ = self.current_song.lyrics_data[i]
-            if timestamp <= self.loop_time and (i == len(self.current_song.lyrics_data) - 1 or 
-                                             self.current_song.lyrics_data[i+1][0] > self.loop_time):
-                current_lyric = lyric
-                if i < len(self.current_song.lyrics_data) - 1:
-                    next_lyric = self.current_song.lyrics_data[i+1][1]
-                else:
-                    # If we're at the last lyric, the next one is the first (for loop)
-                    next_lyric = self.current_song.lyrics_data[0][1]
-                break
+        timeline = self.current_song.timeline
+        current_lyric, next_lyric = timeline.current_and_next(self.loop_time)
                 
         # Draw current lyric
-        current_lyric_text = font_large.render(current_lyric, True, YELLOW)
-        screen.blit(current_lyric_text, (WIDTH//2 - current_lyric_text.get_width()//2, HEIGHT//2 - 50))
+        current_lyric_text = text_cache.render(font_large, current_lyric, YELLOW)
+        renderer.blit(current_lyric_text, (WIDTH//2 - current_lyric_text.get_width()//2, HEIGHT//2 - 50))
         
         # Draw next lyric
-        next_lyric_text = font_medium.render(next_lyric, True, WHITE)
-        screen.blit(next_lyric_text, (WIDTH//2 - next_lyric_text.get_width()//2, HEIGHT//2 + 30))
-        
-        # Draw pitch visualization
-        current_pitch = self.pitch_detector.get_smoothed_pitch()
+        next_lyric_text = text_cache.render(font_medium, next_lyric, WHITE)
+        renderer.blit(next_lyric_text, (WIDTH//2 - next_lyric_text.get_width()//2, HEIGHT//2 + 30))
         
         # Find expected pitch for the current time
-        expected_pitch = 0
-        for i in range(len(self.current_song.lyrics_data)):
-            timestamp, _, pitch = self.current_song.lyrics_data[i]
-            if timestamp <= self.loop_time and (i == len(self.current_song.lyrics_data) - 1 or 
-                                             self.current_song.lyrics_data[i+1][0] > self.loop_time):
-                expected_pitch = pitch
-                break
+        expected_pitch = timeline.expected_pitch(self.loop_time)
         
         # Draw pitch meter
-        self._draw_pitch_meter(current_pitch, expected_pitch)
+        self._draw_pitch_meter(expected_pitch)
         
         # Draw singing guide (last few seconds of pitch history)
         self._draw_pitch_guide()
     
-    def _draw_pitch_meter(self, current_pitch, expected_pitch):
+    def _draw_pitch_meter(self, expected_pitch):
         # Convert pitch to position
         def pitch_to_y(pitch):
             if pitch <= 0:
                 return HEIGHT - 100  # Bottom position for silence
-            
-            # Log scale for better visualization
-            min_pitch = 50   # Hz
-            max_pitch = 1000  # Hz
-            
-            # Clamp pitch to our range
-            pitch = max(min_pitch, min(max_pitch, pitch))
-            
-            # Convert to log scale and map to screen position
-            log_min = math.log10(min_pitch)
-            log_max = math.log10(max_pitch)
-            log_pitch = math.log10(pitch)
-            
-            normalized = (log_pitch - log_min) / (log_max - log_min)
-            return HEIGHT - 100 - normalized * (HEIGHT - 200)
+            return HEIGHT - 100 - float(pitch_to_unit(pitch)) * (HEIGHT - 200)
         
         # Draw pitch scale
-        pygame.draw.rect(screen, WHITE, (WIDTH - 50, 100, 30, HEIGHT - 200), 1)
+        renderer.rect(WHITE, (WIDTH - 50, 100, 30, HEIGHT - 200), 1)
         
         # Draw expected pitch marker
         if expected_pitch > 0:
             expected_y = pitch_to_y(expected_pitch)
-            pygame.draw.rect(screen, GREEN, (WIDTH - 60, expected_y - 5, 50, 10))
-        
-        # Draw current pitch marker
-        if current_pitch > 0:
-            current_y = pitch_to_y(current_pitch)
-            pygame.draw.circle(screen, RED, (WIDTH - 35, current_y), 10)
+            renderer.rect(GREEN, (WIDTH - 60, expected_y - 5, 50, 10))
+        
+        # Draw each singer's current pitch marker
+        for singer in self.singers:
+            current_pitch = singer.detector.get_smoothed_pitch()
+            if current_pitch > 0:
+                current_y = pitch_to_y(current_pitch)
+                renderer.circle(singer.color, (WIDTH - 35, current_y), 10)
+    
+    def _guide_points(self, history, history_len, x, y, width, height):
+        # Screen points for the newest `history_len` values of `history`,
+        # skipping silence and keeping at most one point per pixel column
+        values = history.latest(history_len)
+        step = max(1, len(values) // width)
+        positions = np.arange(0, len(values), step)
+        unit = pitch_to_unit(values[positions])
+        voiced = ~np.isnan(unit)
+        xs = x + positions[voiced] / history_len * width
+        ys = y + height - unit[voiced] * height
+        return list(zip(xs.tolist(), ys.tolist()))
     
     def _draw_pitch_guide(self):
         # Draw a scrolling pitch history/guide
-        if not self.pitch_history:
+        if not len(self.expected_pitch_history):
             return
             
         guide_width = WIDTH - 100
@@ -407,92 +561,111 @@ class KaraokeGame:
         guide_y = HEIGHT - 300
         
         # Draw background
-        pygame.draw.rect(screen, (50, 50, 50), (guide_x, guide_y, guide_width, guide_height))
+        renderer.rect((50, 50, 50), (guide_x, guide_y, guide_width, guide_height))
         
         # Draw grid lines
         for i in range(1, 10):
             line_y = guide_y + i * (guide_height / 10)
-            pygame.draw.line(screen, (100, 100, 100), (guide_x, line_y), (guide_x + guide_width, line_y))
+            renderer.line((100, 100, 100), (guide_x, line_y), (guide_x + guide_width, line_y))
             
-        # Only show the last 100 points or less
-        history_len = min(100, len(self.pitch_history))
+        # Only show the last guide_points points or less
+        history_len = min(self.guide_points, len(self.expected_pitch_history))
         if history_len < 2:
             return
+        
+        # The points only change when a note is scored, so reuse them until then
+        if self._guide_cache[0] != (self.expected_pitch_history.count, history_len):
+            area = (guide_x, guide_y, guide_width, guide_height)
+            self._guide_cache = (
+                (self.expected_pitch_history.count, history_len),
+                self._guide_points(self.expected_pitch_history, history_len, *area),
+                [self._guide_points(singer.pitch_history, history_len, *area) for singer in self.singers],
+            )
+        _, expected_points, singer_points = self._guide_cache
             
         # Draw expected pitch line
-        expected_points = []
-        for i in range(history_len):
-            idx = len(self.expected_pitch_history) - history_len + i
-            if idx >= 0 and idx < len(self.expected_pitch_history):
-                expected_pitch = self.expected_pitch_history[idx]
-                if expected_pitch > 0:
-                    # Convert pitch to position (simplified)
-                    normalized = min(1.0, max(0.0, (math.log(expected_pitch) - math.log(100)) / (math.log(1000) - math.log(100))))
-                    point_x = guide_x + (i / history_len) * guide_width
-                    point_y = guide_y + guide_height - normalized * guide_height
-                    expected_points.append((point_x, point_y))
-        
         if len(expected_points) >= 2:
-            pygame.draw.lines(screen, GREEN, False, expected_points, 2)
-        
-        # Draw actual pitch line
-        points = []
-        for i in range(history_len):
-            idx = len(self.pitch_history) - history_len + i
-            pitch = self.pitch_history[idx]
-            if pitch > 0:
-                # Convert pitch to position (simplified)
-                normalized = min(1.0, max(0.0, (math.log(pitch) - math.log(100)) / (math.log(1000) - math.log(100))))
-                point_x = guide_x + (i / history_len) * guide_width
-                point_y = guide_y + guide_height - normalized * guide_height
-                points.append((point_x, point_y))
-                
-        if len(points) >= 2:
-            pygame.draw.lines(screen, RED, False, points, 2)
+            renderer.lines(GREEN, False, expected_points, 2)
+        
+        # Draw each singer's pitch line
+        for singer, points in zip(self.singers, singer_points):
+            if len(points) >= 2:
+                renderer.lines(singer.color, False, points, 2)
     
     def _draw_results(self):
         # Draw final score
-        title = font_large.render("Game Over!", True, WHITE)
-        screen.blit(title, (WIDTH//2 - title.get_width()//2, 100))
+        title = text_cache.render(font_large, "Game Over!", WHITE)
+        renderer.blit(title, (WIDTH//2 - title.get_width()//2, 100))
         
-        if self.max_score > 0:
-            score_percent = (self.score / self.max_score) * 100
+        if len(self.singers) == 1:
+            score_percent = self.singers[0].percent()
+            score_text = text_cache.render(font_large, f"Final Score: {score_percent:.1f}%", WHITE)
+            renderer.blit(score_text, (WIDTH//2 - score_text.get_width()//2, 200))
+            
+            # Show loop info
+            loops_text = text_cache.render(font_medium, f"Completed Loops: {self.loop_counter}", WHITE)
+            renderer.blit(loops_text, (WIDTH//2 - loops_text.get_width()//2, 250))
+            
+            # Grade based on score
+            grade_text = text_cache.render(font_large, f"Grade: {grade_for(score_percent)}", YELLOW)
+            renderer.blit(grade_text, (WIDTH//2 - grade_text.get_width()//2, 300))
         else:
-            score_percent = 0
+            loops_text = text_cache.render(font_medium, f"Completed Loops: {self.loop_counter}", WHITE)
+            renderer.blit(loops_text, (WIDTH//2 - loops_text.get_width()//2, 160))
             
-        score_text = font_large.render(f"Final Score: {score_percent:.1f}%", True, WHITE)
-        screen.blit(score_text, (WIDTH//2 - score_text.get_width()//2, 200))
-        
-        # Show loop info
-        loops_text = font_medium.render(f"Completed Loops: {self.loop_counter}", True, WHITE)
-        screen.blit(loops_text, (WIDTH//2 - loops_text.get_width()//2, 250))
-        
-        # Grade based on score
-        grade = "F"
-        if score_percent >= 95:
-            grade = "S"
-        elif score_percent >= 90:
-            grade = "A+"
-        elif score_percent >= 80:
-            grade = "A"
-        elif score_percent >= 70:
-            grade = "B"
-        elif score_percent >= 60:
-            grade = "C"
-        elif score_percent >= 50:
-            grade = "D"
-        
-        grade_text = font_large.render(f"Grade: {grade}", True, YELLOW)
-        screen.blit(grade_text, (WIDTH//2 - grade_text.get_width()//2, 300))
+            # One line per singer: score and grade
+            for i, singer in enumerate(self.singers):
+                score_percent = singer.percent()
+                line = f"{singer.name}: {score_percent:.1f}%   Grade: {grade_for(score_percent)}"
+                score_text = text_cache.render(font_medium, line, singer.color)
+                renderer.blit(score_text, (WIDTH//2 - score_text.get_width()//2, 210 + i*36))
+        
+        if self.leaderboard_top is not None and self.leaderboard_top.done():
+            # Below the scores, as many rows as fit above the instructions
+            y = 335 if len(self.singers) == 1 else 220 + len(self.singers) * 36
+            rows = self.leaderboard_top.result()[:max(0, (HEIGHT - 100 - y) // 26 - 1)]
+            if rows:
+                heading = text_cache.render(font_small, "Today's best", WHITE)
+                renderer.blit(heading, (WIDTH//2 - heading.get_width()//2, y))
+            for i, (row, mine) in enumerate(rows):
+                line = f"{i + 1}. {row['player']}  {row['score']:.1f}%  ({row['room']})"
+                text = text_cache.render(font_small, line, YELLOW if mine else WHITE)
+                renderer.blit(text, (WIDTH//2 - text.get_width()//2, y + 26 * (i + 1)))
         
         # Instructions
-        instructions = font_small.render("Press SPACE to return to menu", True, WHITE)
-        screen.blit(instructions, (WIDTH//2 - instructions.get_width()//2, HEIGHT - 100))
+        instructions = text_cache.render(font_small, "Press SPACE to return to menu", WHITE)
+        renderer.blit(instructions, (WIDTH//2 - instructions.get_width()//2, HEIGHT - 100))
+    
+    def _update_stage(self):
+        # The values the pitch meter and score display show right now
+        expected_pitch = 0
+        if self.game_state == "playing":
+            expected_pitch = self.current_song.timeline.expected_pitch(self.loop_time)
+        pitches = [singer.detector.get_smoothed_pitch() if self.game_state == "playing" else 0
+                   for singer in self.singers]
+        self.stage.send_state(self.game_state, float(pitch_to_unit(expected_pitch)),
+                              pitch_to_unit(pitches).tolist(), [singer.percent() for singer in self.singers])
+        
+    def _draw_stats(self):
+        # Refresh the numbers a few times a second so the text cache is not churned
+        now = time.perf_counter()
+        if now >= self.stats_refresh:
+            self.stats_lines = self.instrumentation.overlay_lines()
+            self.stats_refresh = now + 0.25
+        for i, line in enumerate(self.stats_lines):
+            text = text_cache.render(font_stats, line, GREEN)
+            renderer.blit(text, (10, HEIGHT - 20 - (len(self.stats_lines) - i) * 16))
     
     def handle_event(self, event):
         if event.type == pygame.QUIT:
             return False
             
+        # The window was uncovered or restored: static frames are skipped by
+        # the renderer, so repaint everything on the next present()
+        if event.type in (pygame.WINDOWEXPOSED, pygame.VIDEOEXPOSE):
+            if renderer is not None:
+                renderer.invalidate()
+            
         # Check mouse position for button hover
         if event.type == pygame.MOUSEMOTION:
             if self.game_state == "playing":
@@ -504,6 +677,18 @@ class KaraokeGame:
                 if self.game_state == "playing" and self.stop_button.is_clicked(event.pos, True):
                     self.stop_game()
             
+        if event.type == pygame.KEYDOWN and self.search_active:
+            # Typing a search query in the menu
+            if event.key in (pygame.K_RETURN, pygame.K_ESCAPE):
+                self.search_active = False
+            elif event.key == pygame.K_BACKSPACE:
+                self.search_query = self.search_query[:-1]
+                self._update_menu_items()
+            elif event.unicode and event.unicode.isprintable():
+                self.search_query += event.unicode
+                self._update_menu_items()
+            return True
+            
         if event.type == pygame.KEYDOWN:
             if event.key == pygame.K_ESCAPE:
                 if self.game_state == "playing":
@@ -511,16 +696,28 @@ class KaraokeGame:
                 else:
                     return False
                     
+            elif event.key == pygame.K_F3:
+                self.show_stats = not self.show_stats
+                    
             elif event.key == pygame.K_s:  # Additional key for stopping
                 if self.game_state == "playing":
                     self.stop_game()
                     
             elif self.game_state == "menu":
-                # Song selection
+                # Song selection on the current page
                 if pygame.K_1 <= event.key <= pygame.K_9:
-                    song_idx = event.key - pygame.K_1
-                    if song_idx < len(self.songs):
-                        self.select_song(song_idx)
+                    item = self.menu_page * SONGS_PER_PAGE + event.key - pygame.K_1
+                    if item < len(self.menu_items):
+                        self.select_song(self.menu_items[item])
+                        
+                elif event.key in (pygame.K_RIGHT, pygame.K_PAGEDOWN):
+                    self.menu_page = min(self.menu_page + 1, self._menu_pages() - 1)
+                    
+                elif event.key in (pygame.K_LEFT, pygame.K_PAGEUP):
+                    self.menu_page = max(self.menu_page - 1, 0)
+                    
+                elif event.key == pygame.K_SLASH:
+                    self.search_active = True
                         
                 elif event.key == pygame.K_SPACE:
                     if self.current_song:
@@ -533,49 +730,120 @@ class KaraokeGame:
         return True
         
     def run(self):
+        init_display()
         running = True
         while running:
             self.clock.tick(60)  # 60 FPS
+            frame_start = time.perf_counter()
             
             for event in pygame.event.get():
                 running = self.handle_event(event)
                 if not running:
                     break
+            events_done = time.perf_counter()
                     
             self.update()
+            if self.stage is not None:
+                self._update_stage()
+            update_done = time.perf_counter()
             self.draw()
+            draw_done = time.perf_counter()
+            
+            self.instrumentation.record_frame(events_done - frame_start, update_done - events_done,
+                                              draw_done - update_done, draw_done - frame_start)
+            self.instrumentation.record_audio([singer.detector for singer in self.singers])
             
-        self.pitch_detector.cleanup()
+        if self.game_state == "playing":
+            self.stop_game()
+        if self.stats_path:
+            self.instrumentation.export(self.stats_path)
+        # Let the recorders finish writing their sessions
+        for recorder in self.finished_recorders:
+            recorder.join()
+        self.devices_ready()
+        self.capture.cleanup()
+        if self.stage is not None:
+            self.stage.close()
+        if self.leaderboard is not None:
+            self.leaderboard.close()
+        self._startup.shutdown()
         pygame.quit()
 
-# Example song data
-# In a real game, this would be loaded from files
-example_lyrics = [
-    (1.0, "Example lyrics 1", 220.0),  # Timestamp, Lyrics, Expected pitch (Hz)
-    (3.5, "Example lyrics 2", 246.9),
-    (5.0, "Example lyrics 3", 261.6),
-    (8.0, "Example lyrics 4", 293.7),
-    (10.0, "Example lyrics 5", 329.6),
-    (12.0, "Example lyrics 6", 349.2),
-    (14.0, "Example lyrics 7", 392.0),
-]
+def song_from_catalog(library, index):
+    return Song(library.title(index), library.audio_file(index),
+                library.lyrics(index), library.duration(index))
+
+def replay_session(path, speed=1.0):
+    # A game that plays back a recorded session at `speed` and scores it again
+    session = Session(path)
+    meta = session.meta
+    sources = [FileSource.from_wav(session.audio_path(n), speed=speed, loop=False)
+               for n in range(len(meta["audio_offsets"]))]
+    capture = MultiSingerCapture([(sources[n], channel) for n, channel in meta["routes"]])
+    game = KaraokeGame(stats_path=None, capture=capture)
+    game.devices_ready()
+    
+    offset = meta["audio_offsets"][0] or 0.0
+    game.playback = ReplayClock(sources[0], offset, speed)
+    game.play_music = False
+    game.session_end = offset + len(sources[0].samples) / sources[0].sample_rate
+    
+    song = Song(meta["title"], meta["audio_file"], session.lyrics, meta["duration"])
+    song.prepare()
+    game.add_song(song)
+    game.current_song = song
+    game.start_game()
+    return game
 
 # Main function
-def main():
-    game = KaraokeGame()
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pygame karaoke")
+    parser.add_argument("--singers", type=int, default=1,
+                        help="Number of microphones, one per input channel (duets and party mode)")
+    parser.add_argument("--input", default=INPUT,
+                        help="'device', 'device:<name or index>', 'synth:<hz>,...' or a WAV file to replay")
+    parser.add_argument("--record", nargs="?", const=SESSIONS_DIR, metavar="DIR",
+                        help="Record every performance (audio, pitch track and scores) under DIR")
+    parser.add_argument("--replay", metavar="SESSION", help="Replay a recorded session through the game")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed")
+    parser.add_argument("--stage", metavar="PORT",
+                        help="Serial port (or pyserial URL) of LED/score hardware, see stage_output.py")
+    parser.add_argument("--leaderboard", nargs="?", const=LEADERBOARD_ADDRESS, metavar="HOST:PORT",
+                        help="Submit final scores to a leaderboard service, see leaderboard.py")
+    parser.add_argument("--room", help="Room name on the leaderboard (default: host name)")
+    parser.add_argument("--names", default="", help="Singer names for the leaderboard, comma-separated")
+    parser.add_argument("--filters", default=DEFAULT_FILTERS,
+                        help=f"Pitch smoothing stages, comma-separated from {', '.join(FILTERS)} ('' for none)")
+    args = parser.parse_args(argv)
+    
+    if not 1 <= args.singers <= MAX_SINGERS:
+        parser.error(f"--singers must be between 1 and {MAX_SINGERS}")
     
-    # Add songs
-    song1 = Song("Example Song", "a.mp3", example_lyrics)
-    game.add_song(song1)
+    if args.replay:
+        replay_session(args.replay, args.speed).run()
+        return
     
-    # More songs would be added here
+    game = KaraokeGame(open_capture=lambda: MultiSingerCapture.open(args.input, args.singers, filters=args.filters),
+                       sessions_dir=args.record, stage=StageOutput(args.stage) if args.stage else None,
+                       leaderboard=LeaderboardClient(args.leaderboard, args.room) if args.leaderboard else None,
+                       names=[name.strip() for name in args.names.split(",") if name.strip()])
     
-    # Start with first song selected
-    if game.songs:
-        game.select_song(0)
+    if os.path.isdir(SONGS_DIR):
+        # Start from the catalog as it was last built, and pick up any
+        # added or changed songs in the background
+        game.use_library(Library())
+        def refresh_catalog():
+            library, changed = rescan()
+            if changed:
+                game.pending_library = library
+        threading.Thread(target=refresh_catalog, daemon=True).start()
+    else:
+        # Add songs
+        song1 = Song("Example Song", "a.mp3", example_lyrics)
+        game.add_song(song1)
     
     # Run the game
     game.run()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
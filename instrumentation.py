@@ -0,0 +1,114 @@
+import json
+import time
+
+import numpy as np
+
+# ==== SETTINGS ====
+MIN_SECONDS = 1e-6                     # Smallest duration the histograms resolve
+MAX_SECONDS = 10.0                     # Anything longer lands in the last bin
+BINS_PER_DECADE = 20                   # ~12% bin width
+PERCENTILES = (50, 95, 99)
+
+# Fixed-memory histogram of durations in seconds.
+#
+# Bins are log-spaced, so recording is O(1) and memory does not grow with
+# the length of a session, while percentiles stay accurate to one bin width
+# from microseconds up to seconds.  Reported percentiles are the upper edge
+# of the bin they fall in, capped at the largest value actually seen.
+class LatencyHistogram:
+    def __init__(self):
+        decades = np.log10(MAX_SECONDS / MIN_SECONDS)
+        n_bins = int(np.ceil(decades * BINS_PER_DECADE))
+        self.edges = MIN_SECONDS * 10 ** (np.arange(1, n_bins + 1) / BINS_PER_DECADE)
+        self.counts = np.zeros(n_bins, dtype=np.int64)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._log_min = np.log10(MIN_SECONDS)
+
+    def record(self, seconds):
+        if seconds <= MIN_SECONDS:
+            index = 0
+        else:
+            index = min(int((np.log10(seconds) - self._log_min) * BINS_PER_DECADE), len(self.counts) - 1)
+        self.counts[index] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, p):
+        if self.count == 0:
+            return 0.0
+        target = self.count * p / 100
+        index = int(np.searchsorted(np.cumsum(self.counts), target, side="left"))
+        return float(min(self.edges[min(index, len(self.edges) - 1)], self.max))
+
+    def summary(self):
+        result = {"count": self.count, "mean": self.total / self.count if self.count else 0.0, "max": self.max}
+        for p in PERCENTILES:
+            result[f"p{p}"] = self.percentile(p)
+        return result
+
+# Per-session timing for the karaoke loop.
+#
+# Frame phases (event handling, update, draw and the whole frame) are timed
+# by the game loop; capture latency is recorded by each singer's analysis
+# thread; capture-buffer depth and dropped samples are sampled once per
+# frame.  Everything can be shown in an overlay and written to JSON when
+# the session ends.
+class Instrumentation:
+    PHASES = ("events", "update", "draw", "frame")
+
+    def __init__(self):
+        self.histograms = {phase: LatencyHistogram() for phase in self.PHASES}
+        self.audio_latency = None      # Histograms owned by the singers' analysers
+        self.queue_depth = LatencyHistogram()  # Seconds of audio waiting for analysis
+        self.queue_depth_max = 0
+        self.dropped_frames = 0
+        self.started = time.time()
+
+    def record_frame(self, events, update, draw, frame):
+        for phase, seconds in zip(self.PHASES, (events, update, draw, frame)):
+            self.histograms[phase].record(seconds)
+
+    def record_audio(self, detectors):
+        # One analyser per singer: the deepest queue and the total drops count.
+        # No analysers yet while the devices are still opening.
+        if not detectors:
+            return
+        depth = max(detector.audio_buffer.depth() for detector in detectors)
+        self.queue_depth.record(depth / detectors[0].sample_rate)
+        self.queue_depth_max = max(self.queue_depth_max, depth)
+        self.dropped_frames = sum(detector.dropped_frames for detector in detectors)
+        self.audio_latency = [detector.capture_latency for detector in detectors]
+
+    def _audio_histograms(self):
+        if self.audio_latency is None:
+            return []
+        if len(self.audio_latency) == 1:
+            return [("audio", self.audio_latency[0])]
+        return [(f"audio{i + 1}", hist) for i, hist in enumerate(self.audio_latency)]
+
+    def summary(self):
+        result = {phase: hist.summary() for phase, hist in self.histograms.items()}
+        for name, hist in self._audio_histograms():
+            result[name.replace("audio", "audio_latency")] = hist.summary()
+        result["queue_depth"] = self.queue_depth.summary()
+        result["queue_depth_max_samples"] = self.queue_depth_max
+        result["dropped_frames"] = self.dropped_frames
+        return result
+
+    def overlay_lines(self):
+        lines = []
+        hists = list(self.histograms.items()) + self._audio_histograms()
+        for name, hist in hists:
+            values = "  ".join(f"p{p} {hist.percentile(p) * 1000:6.2f}" for p in PERCENTILES)
+            lines.append(f"{name:<7}{values} ms")
+        lines.append(f"queue {self.queue_depth_max} max  dropped {self.dropped_frames}")
+        return lines
+
+    def export(self, path):
+        data = {"started": self.started, "ended": time.time(), "stats": self.summary()}
+        with open(path, "w") as f:
+            json.dump(data, f, indent=1)
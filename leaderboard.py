@@ -0,0 +1,458 @@
+import argparse
+import collections
+import datetime
+import itertools
+import json
+import os
+import queue
+import re
+import socket
+import socketserver
+import sqlite3
+import threading
+import time
+import uuid
+
+# ==== SETTINGS ====
+DB_PATH = "leaderboard.db"             # SQLite database kept by the service
+ADDRESS = "127.0.0.1:47800"            # Where the service listens (host:port)
+BATCH_SIZE = 2000                      # Most rows written per transaction
+QUEUE_LIMIT = 100000                   # Rows waiting for the writer before connections are throttled
+SPOOL_PATH = "leaderboard_spool-{room}.jsonl"  # Per-room store for results the service has not taken yet
+SPOOL_LIMIT = 10000                    # Results kept in the spool; the oldest are dropped beyond this
+RETRY_INTERVAL = 2.0                   # Seconds between attempts to reach the service
+CONNECT_TIMEOUT = 0.5
+SEND_TIMEOUT = 5.0                     # A submission connection that stalls this long is reopened
+QUERY_TIMEOUT = 0.5
+TOP_N = 10
+PERIODS = {"today": 1, "week": 7, "month": 30, "all": None}   # Days, counting today
+
+# Shared leaderboard for every room on one box.
+#
+# One ingestion service owns the SQLite database (WAL mode, so queries run
+# while a batch is being written).  Clients send newline-delimited JSON over
+# TCP; submissions are queued by the connection threads and a single writer
+# thread stores whatever has queued up in one transaction, so commits stay
+# few however many results arrive.  A full queue stops reading from the
+# connections until the writer catches up.  Queries use a read connection per
+# connection thread and are answered on the same line protocol:
+#
+#   {"op": "submit", "records": [record, ...]}     -> {"queued": n}
+#   {"op": "top", "song": ..., "period": ..., "limit": ...}
+#                                                  -> {"rows": [record, ...]}
+#   {"op": "stats"}                                -> {"received": ..., ...}
+#
+# A message that cannot be handled is answered with {"error": ...}.
+#
+# A record is {"id", "song", "player", "room", "score", "grade", "notes",
+# "sung_at"}; `id` is chosen by the client, and a record already stored is
+# ignored, so resending after a lost connection cannot duplicate a score.
+# The reply to a submission only says the records were queued; a service
+# that is shut down still stores its queue, one that crashes loses it.
+#
+# Top-N queries walk an index in score order and stop after N rows: one
+# index for each song, one for all songs, and the same two by day for the
+# periods.  A period query takes the top N of each of its days from the
+# index and merges them, so it reads at most N rows per day whatever the
+# table size.  Days are local calendar days.
+#
+# The game submits through a LeaderboardClient, which only appends to an
+# in-memory queue; a sender thread delivers it.  While the service cannot be
+# reached the queue is kept in a bounded spool file (rewritten at most every
+# RETRY_INTERVAL) and sent first once the service is back, also after a
+# restart of the game.  Each room has its own spool file, named after the
+# room, since a client rewrites the whole file from its own queue; two games
+# on one box need different room names.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scores (
+    id TEXT NOT NULL UNIQUE,
+    song TEXT NOT NULL,
+    player TEXT NOT NULL,
+    room TEXT NOT NULL,
+    score REAL NOT NULL,
+    grade TEXT NOT NULL,
+    notes INTEGER NOT NULL,
+    sung_at REAL NOT NULL,
+    day INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS scores_top ON scores (score DESC);
+CREATE INDEX IF NOT EXISTS scores_song_top ON scores (song, score DESC);
+CREATE INDEX IF NOT EXISTS scores_day_top ON scores (day, score DESC);
+CREATE INDEX IF NOT EXISTS scores_song_day_top ON scores (song, day, score DESC);
+"""
+
+FIELDS = ("id", "song", "player", "room", "score", "grade", "notes", "sung_at")
+
+def day_number(t):
+    # Local calendar day of a Unix time
+    return datetime.date.fromtimestamp(t).toordinal()
+
+def parse_address(address):
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+# ==== STORE ====
+class ScoreStore:
+    def __init__(self, path=DB_PATH, readonly=False):
+        self.path = path
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        if readonly:
+            self.db.execute("PRAGMA query_only = 1")
+        else:
+            self.db.execute("PRAGMA journal_mode = WAL")
+            # In WAL mode a crash can lose the last commits but never corrupts
+            self.db.execute("PRAGMA synchronous = NORMAL")
+            self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def add(self, records):
+        # Store a batch in one transaction; returns the number of new rows.
+        # Records already stored (same id) are skipped.
+        before = self.db.total_changes
+        with self.db:
+            self.db.executemany(
+                "INSERT OR IGNORE INTO scores VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [record + (day_number(record[7]),) for record in records])
+        return self.db.total_changes - before
+
+    def top(self, song=None, period="all", limit=TOP_N, now=None):
+        # Best `limit` scores, of one song or all, within a period of PERIODS
+        days = PERIODS[period]
+        columns = ", ".join(FIELDS)
+        where = "song = ?" if song is not None else "1"
+        base = [song] if song is not None else []
+        if days is None:
+            sql = f"SELECT {columns} FROM scores WHERE {where} ORDER BY score DESC LIMIT ?"
+            params = base + [limit]
+        else:
+            today = day_number(time.time() if now is None else now)
+            part = f"SELECT * FROM (SELECT {columns} FROM scores WHERE {where} AND day = ? ORDER BY score DESC LIMIT ?)"
+            sql = f"SELECT * FROM ({' UNION ALL '.join([part] * days)}) ORDER BY score DESC LIMIT ?"
+            params = []
+            for day in range(today - days + 1, today + 1):
+                params += base + [day, limit]
+            params.append(limit)
+        return [dict(zip(FIELDS, row)) for row in self.db.execute(sql, params)]
+
+def record_row(record):
+    # Tuple in FIELDS order for a submitted record; raises on a bad record
+    row = (str(record["id"]), str(record["song"]), str(record["player"]), str(record["room"]),
+           float(record["score"]), str(record.get("grade", "")), int(record.get("notes", 0)),
+           float(record["sung_at"]))
+    if not 0 <= row[4] <= 100:
+        raise ValueError(f"score out of range: {row[4]}")
+    return row
+
+# ==== SERVICE ====
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        self.store = None
+        service = self.server.service
+        for line in self.rfile:
+            if service.closed:
+                # Unanswered submissions stay with the client
+                break
+            reply = self._reply(service, line)
+            if "error" in reply:
+                service.rejected += 1
+            self.wfile.write(json.dumps(reply).encode() + b"\n")
+        if self.store is not None:
+            self.store.close()
+
+    def _reply(self, service, line):
+        # Every message gets exactly one reply line, {"error": ...} if it is bad
+        try:
+            message = json.loads(line)
+        except ValueError:
+            return {"error": "malformed JSON"}
+        op = message.get("op") if isinstance(message, dict) else None
+        if op == "submit":
+            records = message.get("records")
+            if not isinstance(records, list):
+                return {"error": "submit needs a list of records"}
+            return {"queued": service.ingest(records)}
+        if op == "top":
+            if self.store is None:
+                self.store = ScoreStore(service.db_path, readonly=True)
+            try:
+                return {"rows": self.store.top(message.get("song"), message.get("period", "all"),
+                                               int(message.get("limit", TOP_N)))}
+            except (KeyError, ValueError, TypeError, sqlite3.Error) as e:
+                return {"error": f"bad query: {e}"}
+        if op == "stats":
+            return service.stats()
+        return {"error": f"unknown op: {op!r}"}
+
+class _Server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+class LeaderboardService:
+    def __init__(self, db_path=DB_PATH, address=ADDRESS):
+        self.db_path = db_path
+        self.received = 0              # Records accepted into the queue
+        self.stored = 0                # New rows written
+        self.duplicates = 0            # Records already stored (resent from a spool)
+        self.rejected = 0              # Malformed messages and records
+        self.batches = 0               # Transactions committed
+        self.closed = False
+        self._serving = False
+        self._queue = queue.Queue(QUEUE_LIMIT)
+        self._store = ScoreStore(db_path)
+        self._server = _Server(parse_address(address), _Handler)
+        self._server.service = self
+        self.address = "%s:%d" % self._server.server_address
+        self._writer = threading.Thread(target=self._write, daemon=True)
+        self._writer.start()
+
+    def ingest(self, records):
+        # Called on connection threads; blocks while the queue is full.
+        # Returns the number of records queued.
+        queued = 0
+        for record in records:
+            try:
+                row = record_row(record)
+            except (KeyError, ValueError, TypeError):
+                self.rejected += 1
+                continue
+            self._queue.put(row)
+            self.received += 1
+            queued += 1
+        return queued
+
+    def stats(self):
+        return {"received": self.received, "stored": self.stored, "duplicates": self.duplicates,
+                "rejected": self.rejected, "batches": self.batches, "queued": self._queue.qsize()}
+
+    def serve_forever(self):
+        self._serving = True
+        self._server.serve_forever()
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def shutdown(self):
+        # Stop accepting, then store everything already queued
+        self.closed = True
+        if self._serving:
+            self._server.shutdown()
+        self._server.server_close()
+        self._queue.put(None)
+        self._writer.join()
+        self._store.close()
+
+    def _write(self):
+        # Group commit: each transaction takes everything that queued up
+        # while the previous one was being written
+        running = True
+        while running:
+            batch = [self._queue.get()]
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if batch[-1] is None:
+                running = False
+                batch.pop()
+            if not batch:
+                continue
+            added = self._store.add(batch)
+            self.stored += added
+            self.duplicates += len(batch) - added
+            self.batches += 1
+
+# ==== CLIENT ====
+def request(address, message, timeout=QUERY_TIMEOUT):
+    # Send one query on its own connection and return the reply; raises
+    # OSError if the service does not answer within `timeout`
+    with socket.create_connection(parse_address(address), timeout=timeout) as conn:
+        conn.sendall(json.dumps(message).encode() + b"\n")
+        line = conn.makefile("rb").readline()
+    if not line:
+        raise OSError("no reply from the leaderboard service")
+    return json.loads(line)
+
+class LeaderboardClient:
+    def __init__(self, address=ADDRESS, room=None, spool_path=None, spool_limit=SPOOL_LIMIT):
+        self.address = address
+        self.room = room or socket.gethostname()
+        # Room names become part of a file name; keep them to safe characters
+        self.spool_path = spool_path or SPOOL_PATH.format(room=re.sub(r"[^\w.-]", "_", self.room))
+        self.connected = False
+        self.sent = 0                  # Records handed to the service
+        self.dropped = 0               # Oldest records dropped from a full spool
+        self.errors = 0                # Failed connections and sends
+        self._lock = threading.Lock()  # Guards the queue only, never held during I/O
+        self._pending = collections.deque(self._load_spool(), maxlen=spool_limit)
+        self._wake = threading.Event()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, song, player, score, grade="", notes=0, sung_at=None):
+        # Never blocks; returns the record, whose id identifies it in queries
+        record = {"id": uuid.uuid4().hex, "song": song, "player": player, "room": self.room,
+                  "score": round(float(score), 2), "grade": grade, "notes": int(notes),
+                  "sung_at": time.time() if sung_at is None else sung_at}
+        with self._lock:
+            if len(self._pending) == self._pending.maxlen:
+                self.dropped += 1
+            self._pending.append(record)
+        self._wake.set()
+        return record
+
+    def pending(self):
+        return len(self._pending)
+
+    def top(self, song=None, period="all", limit=TOP_N):
+        # Blocking query, for a background thread; raises OSError if the
+        # service cannot be reached or refuses, ValueError on a garbled reply
+        reply = request(self.address, {"op": "top", "song": song, "period": period, "limit": limit})
+        if isinstance(reply, dict) and "error" in reply:
+            raise OSError(f"leaderboard service: {reply['error']}")
+        rows = reply.get("rows") if isinstance(reply, dict) else None
+        if not isinstance(rows, list) or not all(isinstance(row, dict) and set(FIELDS) <= row.keys()
+                                                 for row in rows):
+            raise ValueError("bad reply from the leaderboard service")
+        return rows
+
+    def close(self, timeout=2.0):
+        # Send what is queued if the service is up, spool the rest
+        self._running = False
+        self._wake.set()
+        self._thread.join(timeout)
+
+    # ==== SPOOL ====
+    def _load_spool(self):
+        records = []
+        try:
+            with open(self.spool_path) as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        pass           # Torn last line
+        except OSError:
+            pass
+        return records
+
+    def _save_spool(self):
+        with self._lock:
+            records = list(self._pending)
+        if not records:
+            if os.path.exists(self.spool_path):
+                os.remove(self.spool_path)
+            return
+        tmp_path = self.spool_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+        os.replace(tmp_path, self.spool_path)
+
+    # ==== SENDER THREAD ====
+    def _send(self, conn):
+        # Send the queue in batches; records leave it only once the service
+        # has replied that it queued them
+        replies = conn.makefile("rb")
+        while True:
+            with self._lock:
+                batch = list(itertools.islice(self._pending, BATCH_SIZE))
+            if not batch:
+                return
+            conn.sendall(json.dumps({"op": "submit", "records": batch}).encode() + b"\n")
+            if not replies.readline():
+                raise ConnectionError("leaderboard service closed the connection")
+            with self._lock:
+                # Records dropped from a full queue meanwhile were the oldest,
+                # i.e. the front of this batch
+                for record in batch:
+                    if self._pending and self._pending[0] is record:
+                        self._pending.popleft()
+            self.sent += len(batch)
+
+    def _run(self):
+        conn = None
+        next_connect = 0.0
+        next_save = 0.0
+        spooled = bool(self._pending)
+        while True:
+            running = self._running
+            if running:
+                self._wake.wait(RETRY_INTERVAL)
+                self._wake.clear()
+            now = time.monotonic()
+            if conn is None and self._pending and (now >= next_connect or not running):
+                try:
+                    conn = socket.create_connection(parse_address(self.address), timeout=CONNECT_TIMEOUT)
+                    conn.settimeout(SEND_TIMEOUT)
+                    self.connected = True
+                except OSError:
+                    self.errors += 1
+                    next_connect = now + RETRY_INTERVAL
+            if conn is not None:
+                try:
+                    self._send(conn)
+                except OSError:
+                    self.errors += 1
+                    self.connected = False
+                    conn.close()
+                    conn = None
+                    next_connect = now + RETRY_INTERVAL
+            # Keep the spool file in step with the queue while the service is
+            # away, and remove it once everything has been delivered
+            if self._pending and (conn is None or not running):
+                if now >= next_save or not running:
+                    self._save_spool()
+                    spooled = True
+                    next_save = now + RETRY_INTERVAL
+            elif spooled and not self._pending:
+                self._save_spool()
+                spooled = False
+            if not running:
+                break
+        if conn is not None:
+            conn.close()
+        self.connected = False
+
+# ==== COMMAND LINE ====
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Karaoke leaderboard service")
+    parser.add_argument("--address", default=ADDRESS, help="host:port of the service")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("serve", help="Run the ingestion service")
+    serve.add_argument("--db", default=DB_PATH)
+    top = commands.add_parser("top", help="Show the best scores")
+    top.add_argument("song", nargs="?", help="Song title (all songs if omitted)")
+    top.add_argument("--period", choices=PERIODS, default="all")
+    top.add_argument("-n", "--limit", type=int, default=TOP_N)
+    commands.add_parser("stats", help="Show the service's counters")
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        service = LeaderboardService(args.db, args.address)
+        print(f"Leaderboard on {service.address}, storing in {args.db}")
+        try:
+            service.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        service.shutdown()
+    elif args.command == "top":
+        reply = request(args.address, {"op": "top", "song": args.song, "period": args.period,
+                                       "limit": args.limit})
+        if "error" in reply:
+            parser.exit(1, f"leaderboard: {reply['error']}\n")
+        for rank, row in enumerate(reply["rows"], 1):
+            sung = time.strftime("%Y-%m-%d %H:%M", time.localtime(row["sung_at"]))
+            song = "" if args.song else f"  {row['song']}"
+            print(f"{rank:3d}. {row['score']:6.2f}%  {row['grade']:2s}  {row['player']:16s} {row['room']:12s} {sung}{song}")
+    else:
+        for name, value in request(args.address, {"op": "stats"}).items():
+            print(f"{name:10s} {value}")
+
+if __name__ == "__main__":
+    main()
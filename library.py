@@ -0,0 +1,271 @@
+import argparse
+import mmap
+import os
+import shutil
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from song_loader import probe_duration
+from songs import load_lyrics
+
+# ==== SETTINGS ====
+SONGS_DIR = "songs"                    # One audio file + same-named .json lyrics per song
+CATALOG_DIR = ".catalog"               # Where the compiled catalog lives
+AUDIO_EXTENSIONS = (".mp3", ".wav", ".ogg")
+
+ENTRY_DTYPE = np.dtype([
+    ("audio", "i8", 2),                # (offset, length) into strings
+    ("title", "i8", 2),
+    ("lyrics_start", "i8"),            # First row in the lyric_* arrays
+    ("lyrics_count", "i8"),
+    ("duration", "f8"),
+    ("audio_size", "i8"),
+    ("audio_mtime", "i8"),
+    ("lyrics_size", "i8"),
+    ("lyrics_mtime", "i8"),
+])
+
+# On-disk song catalog.
+#
+# Everything the menu and the game need about a song (title, audio path,
+# duration and lyric timeline with reference pitches) is stored
+# in flat .npy arrays that are memory-mapped on open, so opening a catalog of
+# any size only maps a handful of files; pages are read as songs are shown.
+# Strings live in one UTF-8 blob addressed by (offset, length) pairs.  Titles
+# are also kept lower-cased, one per line, in titles.txt, which search()
+# scans with mmap.find without loading it.
+#
+# Each rescan writes a new generation directory and then atomically points
+# CURRENT at it, so a running game never sees a half-written catalog.
+
+# ==== READING ====
+class Library:
+    def __init__(self, catalog_dir=CATALOG_DIR):
+        self.catalog_dir = catalog_dir
+        self.generation = None
+        self.entries = np.zeros(0, dtype=ENTRY_DTYPE)
+        self._titles = None
+        try:
+            with open(os.path.join(catalog_dir, "CURRENT")) as f:
+                self.generation = f.read().strip()
+        except OSError:
+            return
+
+        path = os.path.join(catalog_dir, self.generation)
+        load = lambda name: np.load(os.path.join(path, name + ".npy"), mmap_mode="r")
+        self.entries = load("entries")
+        self.strings = load("strings")
+        self.lyric_times = load("lyric_times")
+        self.lyric_pitches = load("lyric_pitches")
+        self.lyric_text = load("lyric_text")
+        self.title_lines = load("title_lines")
+        self._titles_path = os.path.join(path, "titles.txt")
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _string(self, span):
+        offset, length = int(span[0]), int(span[1])
+        return bytes(self.strings[offset:offset + length]).decode("utf-8")
+
+    def title(self, index):
+        return self._string(self.entries[index]["title"])
+
+    def audio_file(self, index):
+        return self._string(self.entries[index]["audio"])
+
+    def duration(self, index):
+        return float(self.entries[index]["duration"])
+
+    def lyrics(self, index):
+        entry = self.entries[index]
+        rows = slice(int(entry["lyrics_start"]), int(entry["lyrics_start"] + entry["lyrics_count"]))
+        texts = [self._string(span) for span in self.lyric_text[rows]]
+        return list(zip(self.lyric_times[rows].tolist(), texts, self.lyric_pitches[rows].tolist()))
+
+    def search(self, query):
+        # Indices of songs whose title contains `query` (case-insensitive)
+        if not len(self.entries) or not query:
+            return list(range(len(self.entries)))
+        needle = query.lower().encode("utf-8")
+        if self._titles is None:
+            with open(self._titles_path, "rb") as f:
+                self._titles = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        matches = []
+        pos = self._titles.find(needle)
+        while pos >= 0:
+            index = int(np.searchsorted(self.title_lines, pos, side="right")) - 1
+            matches.append(index)
+            # Continue after the end of this title so each song is listed once
+            if index + 1 >= len(self.title_lines):
+                break
+            pos = self._titles.find(needle, int(self.title_lines[index + 1]))
+        return matches
+
+# Sequence view of a Library for the menu: songs are built on demand by
+# `make_song(library, index)` and the most recently used ones are kept, so
+# the same index keeps giving the same object while it is on screen.
+class CatalogSongs:
+    def __init__(self, library, make_song, cache_size=64):
+        self.library = library
+        self.make_song = make_song
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+
+    def __len__(self):
+        return len(self.library)
+
+    def __getitem__(self, index):
+        song = self._cache.get(index)
+        if song is None:
+            song = self.make_song(self.library, index)
+            self._cache[index] = song
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(index)
+        return song
+
+    def search(self, query):
+        return self.library.search(query)
+
+# ==== BUILDING ====
+def _stat_pair(path):
+    try:
+        st = os.stat(path)
+        return st.st_size, st.st_mtime_ns
+    except OSError:
+        return -1, -1
+
+def scan_songs(songs_dir):
+    # (audio path, lyrics path) for every song in `songs_dir`
+    found = []
+    for entry in sorted(os.scandir(songs_dir), key=lambda e: e.name):
+        stem, ext = os.path.splitext(entry.name)
+        if ext.lower() not in AUDIO_EXTENSIONS:
+            continue
+        lyrics = os.path.join(songs_dir, stem + ".json")
+        if os.path.exists(lyrics):
+            found.append((entry.path, lyrics))
+    return found
+
+def rescan(songs_dir=SONGS_DIR, catalog_dir=CATALOG_DIR, verbose=False):
+    # Rebuild the catalog, re-reading only songs whose audio or lyrics changed.
+    # Returns the new Library and the number of songs that were (re)read.
+    old = Library(catalog_dir)
+    old_index = {old.audio_file(i): i for i in range(len(old))}
+
+    entries = []
+    strings = bytearray()
+    titles = bytearray()
+    title_lines = []
+    lyric_times, lyric_pitches, lyric_text = [], [], []
+    lyrics_total = 0
+    changed = 0
+
+    def add_string(text):
+        data = text.encode("utf-8")
+        offset = len(strings)
+        strings.extend(data)
+        return offset, len(data)
+
+    for audio, lyrics_path in scan_songs(songs_dir):
+        audio_stat = _stat_pair(audio)
+        lyrics_stat = _stat_pair(lyrics_path)
+        i = old_index.get(audio, -1)
+        if i >= 0:
+            e = old.entries[i]
+            unchanged = (int(e["audio_size"]), int(e["audio_mtime"])) == audio_stat and \
+                        (int(e["lyrics_size"]), int(e["lyrics_mtime"])) == lyrics_stat
+        else:
+            unchanged = False
+
+        try:
+            if unchanged:
+                title = old.title(i)
+                duration = old.duration(i)
+                lyrics = old.lyrics(i)
+            else:
+                title = os.path.splitext(os.path.basename(audio))[0].replace("_", " ")
+                duration, _ = probe_duration(audio)
+                lyrics = sorted(load_lyrics(lyrics_path))
+                changed += 1
+                if verbose:
+                    print(f"Indexed {audio}")
+        except (OSError, ValueError, TypeError) as e:
+            # Unreadable audio header or malformed lyric file; one bad song
+            # must not stop the rest of the catalog from being built
+            print(f"Skipping {audio}: {e}")
+            continue
+
+        row = np.zeros((), dtype=ENTRY_DTYPE)
+        row["audio"] = add_string(audio)
+        row["title"] = add_string(title)
+        row["lyrics_start"] = lyrics_total
+        row["lyrics_count"] = len(lyrics)
+        row["duration"] = duration
+        row["audio_size"], row["audio_mtime"] = audio_stat
+        row["lyrics_size"], row["lyrics_mtime"] = lyrics_stat
+        entries.append(row)
+
+        for t, text, pitch in lyrics:
+            lyric_times.append(t)
+            lyric_pitches.append(pitch)
+            lyric_text.append(add_string(text))
+        lyrics_total += len(lyrics)
+
+        title_lines.append(len(titles))
+        titles.extend(title.lower().encode("utf-8") + b"\n")
+
+    # Removed songs count as changes too, so an unchanged catalog is not rewritten
+    removed = len(old) - (len(entries) - changed)
+    if old.generation is not None and changed == 0 and removed == 0:
+        return old, 0
+
+    generation = f"gen-{time.time_ns()}"
+    path = os.path.join(catalog_dir, generation)
+    os.makedirs(path)
+    save = lambda name, array: np.save(os.path.join(path, name + ".npy"), array)
+    save("entries", np.array(entries, dtype=ENTRY_DTYPE))
+    save("strings", np.frombuffer(bytes(strings), dtype=np.uint8))
+    save("lyric_times", np.array(lyric_times, dtype=np.float64))
+    save("lyric_pitches", np.array(lyric_pitches, dtype=np.float64))
+    save("lyric_text", np.array(lyric_text, dtype=np.int64).reshape(-1, 2))
+    save("title_lines", np.array(title_lines, dtype=np.int64))
+    with open(os.path.join(path, "titles.txt"), "wb") as f:
+        f.write(bytes(titles))
+
+    current = os.path.join(catalog_dir, "CURRENT")
+    with open(current + ".tmp", "w") as f:
+        f.write(generation)
+    os.replace(current + ".tmp", current)
+
+    # Older generations may still be mapped by a running game; drop all but the previous one
+    for name in os.listdir(catalog_dir):
+        if name.startswith("gen-") and name not in (generation, old.generation):
+            shutil.rmtree(os.path.join(catalog_dir, name), ignore_errors=True)
+
+    return Library(catalog_dir), changed
+
+# ==== COMMAND LINE ====
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or query the song catalog")
+    parser.add_argument("songs_dir", nargs="?", default=SONGS_DIR)
+    parser.add_argument("--catalog", default=CATALOG_DIR)
+    parser.add_argument("--search", help="List songs whose title contains this text")
+    args = parser.parse_args(argv)
+
+    if args.search is not None:
+        library = Library(args.catalog)
+        for i in library.search(args.search):
+            print(f"{i:6d}  {library.title(i)}  ({library.duration(i):.0f}s)")
+        return
+
+    start = time.perf_counter()
+    library, changed = rescan(args.songs_dir, args.catalog, verbose=True)
+    print(f"{len(library)} songs, {changed} re-read, {time.perf_counter() - start:.2f}s")
+
+if __name__ == "__main__":
+    main()
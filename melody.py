@@ -0,0 +1,166 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from contour import hz_to_midi
+from library import SONGS_DIR, scan_songs
+from song_loader import probe_duration
+from songs import save_lyrics
+from yin import frames, yin
+
+# ==== SETTINGS ====
+SAMPLE_RATE = 22050                    # Analysis sample rate
+FRAME_LENGTH = 2048                    # YIN frame
+HOP_LENGTH = 512                       # YIN hop (~23 ms)
+FMIN = 65.4                            # Melody search range (C2..C6)
+FMAX = 1046.5
+YIN_THRESHOLD = 0.1
+SEGMENT_SECONDS = 30.0                 # Audio analysed per pool task
+OVERLAP_SECONDS = 0.5                  # Decoded either side of a segment and discarded
+MIN_CONFIDENCE = 0.8                   # Frames below this count as unvoiced
+MIN_VOICED = 0.25                      # Voiced share of a note needed to give it a target
+
+# Reference-melody extraction for authoring lyric files.
+#
+# Fills in the expected pitch of every lyric from the reference track, so
+# lyric files only need timestamps and text.  Each track is cut into
+# SEGMENT_SECONDS segments and all segments of all tracks go to one process
+# pool, so an album keeps every core busy even when its tracks differ in
+# length.  A worker decodes its segment plus OVERLAP_SECONDS either side
+# (decoder and resampler edges, and the context a YIN frame needs), runs YIN
+# and keeps only the frames centred inside its own segment.  Concatenating the
+# segments in order then gives one contour without gaps or duplicate frames.
+#
+# A lyric's target is the median pitch of the voiced frames between its
+# timestamp and the next one, snapped to the nearest semitone by default;
+# lyrics with too little voiced audio get 0 (not scored).
+
+# ==== EXTRACTION ====
+def on_hop_grid(seconds):
+    # Nearest time at which a frame is centred (frame i at i * HOP_LENGTH)
+    return round(seconds * SAMPLE_RATE / HOP_LENGTH) * HOP_LENGTH / SAMPLE_RATE
+
+def plan_segments(duration):
+    # (start, end) seconds of each segment of a track, on the frame grid so
+    # every segment's frames line up with a whole-track analysis
+    count = max(1, int(np.ceil(duration / SEGMENT_SECONDS)))
+    bounds = [on_hop_grid(t) for t in np.linspace(0, duration, count + 1)]
+    bounds[-1] = duration
+    return list(zip(bounds[:-1], bounds[1:]))
+
+def extract_segment(task):
+    # (frame times, pitch, confidence) for one segment; runs in a pool worker
+    import librosa
+    path, start, end, duration = task
+    margin = on_hop_grid(OVERLAP_SECONDS)
+    load_start = max(0.0, start - margin)
+    y, _ = librosa.load(path, sr=SAMPLE_RATE, offset=load_start, duration=end + margin - load_start)
+    # Zero-pad the ends of the track, like a centred whole-track analysis
+    pad = FRAME_LENGTH // 2
+    y = np.pad(y, (pad if start == 0 else 0, pad if end + margin >= duration else 0))
+    if start == 0:
+        load_start -= pad / SAMPLE_RATE
+    pitch, confidence = yin(frames(y, FRAME_LENGTH, HOP_LENGTH), SAMPLE_RATE,
+                            fmin=FMIN, fmax=FMAX, threshold=YIN_THRESHOLD)
+    times = load_start + (np.arange(len(pitch)) * HOP_LENGTH + FRAME_LENGTH // 2) / SAMPLE_RATE
+    mine = (times >= start) & (times < end)
+    return times[mine], pitch[mine], confidence[mine]
+
+def extract_melodies(paths, workers=None):
+    # [(times, pitch, confidence)] per track, all segments analysed in parallel
+    tasks, owners = [], []
+    for i, path in enumerate(paths):
+        duration, _ = probe_duration(path)
+        for start, end in plan_segments(duration):
+            tasks.append((path, start, end, duration))
+            owners.append(i)
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+        results = list(pool.map(extract_segment, tasks))
+
+    melodies = []
+    for i in range(len(paths)):
+        parts = [r for r, owner in zip(results, owners) if owner == i]
+        melodies.append(tuple(np.concatenate(column) for column in zip(*parts)))
+    return melodies
+
+# ==== LYRIC FILES ====
+def load_lyric_rows(path):
+    # Lyric rows as (timestamp, lyric, pitch); files being authored may give
+    # only [timestamp, lyric], whose pitch is 0 until it is filled in
+    with open(path) as f:
+        rows = json.load(f)
+    lyrics_data = []
+    for row in rows:
+        if not isinstance(row, list) or len(row) not in (2, 3):
+            raise ValueError(f"{path}: expected [timestamp, lyric] or [timestamp, lyric, pitch], got {row!r}")
+        lyrics_data.append((float(row[0]), str(row[1]), float(row[2]) if len(row) == 3 else 0.0))
+    return lyrics_data
+
+# ==== QUANTISATION ====
+def note_targets(lyrics_data, times, pitch, confidence, snap=True):
+    # lyrics_data with each expected pitch replaced by the sung melody
+    starts = np.array([entry[0] for entry in lyrics_data], dtype=np.float64)
+    order = np.argsort(starts, kind="stable")
+    ends = np.append(starts[order][1:], times[-1] if len(times) else 0.0)
+    first = np.searchsorted(times, starts[order])
+    last = np.searchsorted(times, ends)
+    midi = hz_to_midi(np.where((confidence >= MIN_CONFIDENCE) & (pitch >= FMIN) & (pitch <= FMAX), pitch, 0))
+
+    targets = np.zeros(len(lyrics_data))
+    for note, a, b in zip(order, first, last):
+        voiced = midi[a:b][~np.isnan(midi[a:b])]
+        if b > a and len(voiced) >= MIN_VOICED * (b - a):
+            m = np.median(voiced)
+            if snap:
+                m = np.round(m)
+            targets[note] = round(440 * 2 ** ((m - 69) / 12), 1)
+    # Rows may carry a pitch or not; only timestamp and lyric are kept
+    return [(entry[0], entry[1], float(hz)) for entry, hz in zip(lyrics_data, targets)]
+
+# ==== COMMAND LINE ====
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fill in lyric pitch targets from reference tracks")
+    parser.add_argument("inputs", nargs="*", default=[SONGS_DIR],
+                        help="Songs directories or audio files, each with a same-named .json lyric file")
+    parser.add_argument("-o", "--output", help="Write lyric files here instead of updating them in place")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="Worker processes")
+    parser.add_argument("--no-snap", action="store_true", help="Keep exact median pitches")
+    args = parser.parse_args(argv)
+
+    songs = []
+    for path in args.inputs:
+        if os.path.isdir(path):
+            songs.extend(scan_songs(path))
+        else:
+            songs.append((path, os.path.splitext(path)[0] + ".json"))
+    if not songs:
+        parser.error("no songs with lyric files found")
+    # Read every lyric file first, so a malformed one stops the run before
+    # the analysis rather than after it
+    try:
+        lyrics = [load_lyric_rows(lyrics_path) for _, lyrics_path in songs]
+    except (OSError, ValueError, TypeError) as e:
+        parser.error(str(e))
+
+    start = time.perf_counter()
+    melodies = extract_melodies([audio for audio, _ in songs], args.workers)
+    elapsed = time.perf_counter() - start
+
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+    total = 0.0
+    for (audio, lyrics_path), rows, (times, pitch, confidence) in zip(songs, lyrics, melodies):
+        lyrics_data = note_targets(rows, times, pitch, confidence, not args.no_snap)
+        out = os.path.join(args.output, os.path.basename(lyrics_path)) if args.output else lyrics_path
+        save_lyrics(out, lyrics_data)
+        voiced = sum(1 for entry in lyrics_data if entry[2] > 0)
+        total += len(times) * HOP_LENGTH / SAMPLE_RATE
+        print(f"{os.path.basename(audio)}: {voiced}/{len(lyrics_data)} lyrics with a target -> {out}")
+    print(f"Analysed {len(songs)} track(s), {total:.0f}s of audio in {elapsed:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,37 @@
-import sounddevice as sd
+import time
 import numpy as np
 import scipy.io.wavfile as wav
+from capture import INPUT, open_source
 
 DURATION = 10  # seconds
 SAMPLERATE = 22050  # Hz
 FILENAME = "test_recording.wav"
 
-print("🎙️ Recording for 10 seconds...")
+def main():
+    print(f"🎙️ Recording for {DURATION} seconds...")
 
-# Record audio
-recording = sd.rec(int(DURATION * SAMPLERATE), samplerate=SAMPLERATE, channels=1, dtype='float32')
-sd.wait()
+    # Record audio through the same capture path as the game
+    source = open_source(INPUT, channels=1, sample_rate=SAMPLERATE)
+    blocks = []
+    source.add_sink(lambda block, captured_at: blocks.append(block[:, 0].copy()))
+    source.start()
+    time.sleep(DURATION)
+    source.stop()
+    source.close()
+    if not blocks:
+        print("❌ No audio arrived from the input; nothing recorded")
+        return
+    recording = np.concatenate(blocks)[:int(DURATION * SAMPLERATE)]
+    if len(recording) < DURATION * SAMPLERATE:
+        print(f"⚠️ Only {len(recording) / SAMPLERATE:.1f}s of audio arrived (input stalled or dropped blocks)")
 
-# Normalize to int16 for saving
-recording_int16 = np.int16(recording * 32767)
+    # Normalize to int16 for saving
+    recording_int16 = np.int16(recording * 32767)
 
-# Save to WAV
-wav.write(FILENAME, SAMPLERATE, recording_int16)
+    # Save to WAV
+    wav.write(FILENAME, SAMPLERATE, recording_int16)
 
-print(f"✅ Recording saved as '{FILENAME}'")
+    print(f"✅ Recording saved as '{FILENAME}'")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+from capture import open_source
+from pitch_analysis import PitchAnalyser
+from scoring import BUFFER_SIZE
+
+# ==== SETTINGS ====
+MAX_SINGERS = 8
+
+# Singers captured from one or more sources, one singer per channel.
+#
+# Singers are given as (source, channel) pairs (see capture.py).  Singers on
+# the same source share its callback, so a multi-channel interface costs one
+# stream and one callback however many singers it carries.  In the callback
+# each singer's channel is a strided column view of the interleaved block (no
+# copy) that goes straight into that singer's PitchAnalyser, whose own thread
+# does the pitch analysis.  Per-block work in the callback is therefore one
+# ring-buffer write per singer, and analysis cost grows linearly with the
+# singer count.  A single microphone is simply the one-singer case.
+class MultiSingerCapture:
+    def __init__(self, singers, buffer_size=BUFFER_SIZE, **analyser_kwargs):
+        if not 1 <= len(singers) <= MAX_SINGERS:
+            raise ValueError(f"between 1 and {MAX_SINGERS} singers are supported, got {len(singers)}")
+        self.buffer_size = buffer_size
+        self.detectors = []
+        self.sources = []
+        self.routes = []               # [source index, channel] of each singer
+
+        # source -> [(channel, analyser)], in singer order
+        channel_maps = {}
+        for source, channel in singers:
+            if not 0 <= channel < source.channels:
+                raise ValueError(f"channel {channel} not available, the source has {source.channels}")
+            detector = PitchAnalyser(source.sample_rate, buffer_size, **analyser_kwargs)
+            self.detectors.append(detector)
+            if source not in channel_maps:
+                channel_maps[source] = []
+                self.sources.append(source)
+            channel_maps[source].append((channel, detector))
+            self.routes.append([self.sources.index(source), channel])
+
+        for source in self.sources:
+            source.add_sink(self._make_sink(channel_maps[source], wait=not source.realtime))
+
+    @classmethod
+    def from_source(cls, source, count=None, **kwargs):
+        # `count` singers (default: one per channel) on channels 0..count-1
+        count = source.channels if count is None else count
+        return cls([(source, channel) for channel in range(count)], **kwargs)
+
+    @classmethod
+    def open(cls, spec, count=1, sample_rate=44100, **kwargs):
+        # `count` singers on the input named by `spec` (see capture.open_source)
+        return cls.from_source(open_source(spec, channels=count, sample_rate=sample_rate), count, **kwargs)
+
+    def _make_sink(self, channel_map, wait):
+        def sink(block, captured_at):
+            for channel, detector in channel_map:
+                detector.feed(block[:, channel], captured_at, wait)
+        return sink
+
+    def start_recording(self):
+        for detector in self.detectors:
+            detector.start_analysis()
+        for source in self.sources:
+            source.start()
+
+    def stop_recording(self):
+        for source in self.sources:
+            source.stop()
+        for detector in self.detectors:
+            detector.stop_analysis()
+
+    @property
+    def input_latency(self):
+        return max(source.input_latency for source in self.sources)
+
+    def cleanup(self):
+        for source in self.sources:
+            source.close()
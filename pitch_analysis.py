@@ -0,0 +1,129 @@
+import threading
+import time
+
+from instrumentation import LatencyHistogram
+from pitch_stream import PitchStream
+from ring_buffer import AudioRingBuffer
+from pitch_filters import DEFAULT_FILTERS, PitchSmoother, make_filters
+from scoring import BUFFER_SIZE, analyse_hops
+
+# Pitch analysis for one audio channel.
+#
+# A capture source feeds mono float32 blocks in with feed(); they go into
+# a fixed-size ring buffer and an analysis thread runs YIN (yin.py) on every
+# hop as soon as it arrives, smooths it (see pitch_filters.py) and publishes
+# (capture_time, pitch, confidence, smoothed) records into a PitchStream.
+# Hops that arrived together are analysed in one call.  The game only ever
+# reads the stream, so it never waits on audio.  One analyser exists per
+# singer; each has its own thread, ring buffer and smoother, so nothing is
+# shared between singers.
+class PitchAnalyser:
+    def __init__(self, sample_rate=44100, buffer_size=BUFFER_SIZE, ring_buffers=32, filters=DEFAULT_FILTERS):
+        self.sample_rate = sample_rate
+        self.buffer_size = buffer_size
+        # Adaptive confidence gate and smoothing filters, run once per hop
+        self.smoother = PitchSmoother(make_filters(filters))
+
+        self.is_recording = False
+        # Fixed-size capture buffer (~0.75 s at the defaults); if analysis
+        # falls behind, the oldest audio is dropped rather than queued forever
+        self.audio_buffer = AudioRingBuffer(self.buffer_size * ring_buffers)
+        # (write_index, perf_counter) of the latest capture, used to timestamp hops
+        self._capture_mark = (0, time.perf_counter())
+        self._data_ready = threading.Event()
+        self._space_ready = threading.Event()
+
+        # Every analysed hop ends up here as (capture_time, pitch, confidence, smoothed)
+        self.pitch_stream = PitchStream()
+        # Time from the end of a hop's capture until its pitch is published
+        self.capture_latency = LatencyHistogram()
+
+    # ==== PRODUCER ====
+    def feed(self, samples, captured_at=None, wait=False):
+        # Called by the capture source with the block that finished at
+        # perf_counter time `captured_at` (now if not given).  Sources that
+        # are not real-time pass wait=True to block until the analysis has
+        # made room, instead of overrunning the ring buffer.
+        if wait:
+            while self.is_recording and \
+                    self.audio_buffer.capacity - self.audio_buffer.depth() < len(samples):
+                self._space_ready.wait(timeout=0.1)
+                self._space_ready.clear()
+        self.audio_buffer.write(samples)
+        self._capture_mark = (self.audio_buffer.write_index,
+                              time.perf_counter() if captured_at is None else captured_at)
+        self._data_ready.set()
+
+    # ==== ANALYSIS ====
+    def start_analysis(self):
+        # Forget audio and pitches left over from a previous game
+        self.audio_buffer.read_latest(0)
+        self.pitch_stream.reset()
+        self.smoother.reset()
+
+        self.is_recording = True
+        self.analysis_thread = threading.Thread(target=self._analyse)
+        self.analysis_thread.daemon = True
+        self.analysis_thread.start()
+
+    def stop_analysis(self):
+        self.is_recording = False
+        self._data_ready.set()
+        self._space_ready.set()
+        if hasattr(self, 'analysis_thread'):
+            self.analysis_thread.join(timeout=1)
+
+    def _analyse(self):
+        # Run pitch detection on every captured hop as soon as it arrives,
+        # independently of the render loop
+        while self.is_recording:
+            self._data_ready.clear()
+            while True:
+                # Every complete hop available (overruns may move read_index)
+                n_hops = self.audio_buffer.available() // self.buffer_size
+                if n_hops == 0:
+                    break
+                # Copied: once read, a backpressured source may refill the space
+                hops = self.audio_buffer.read(n_hops * self.buffer_size).reshape(n_hops, self.buffer_size).copy()
+                self._space_ready.set()
+                pitches, confidences, levels = analyse_hops(hops, self.sample_rate)
+
+                mark_index, mark_time = self._capture_mark
+                first_end = self.audio_buffer.read_index - (n_hops - 1) * self.buffer_size
+                for i in range(n_hops):
+                    hop_end = first_end + i * self.buffer_size
+                    capture_time = mark_time - (mark_index - hop_end) / self.sample_rate
+                    # The filters run on audio time, not capture time, so a
+                    # replay at any speed smooths exactly like pitch_track()
+                    smoothed = self.smoother(hop_end / self.sample_rate, pitches[i], confidences[i], levels[i])
+                    self.pitch_stream.append(capture_time, pitches[i], confidences[i], smoothed)
+                    self.capture_latency.record(time.perf_counter() - capture_time)
+            self._data_ready.wait(timeout=0.1)
+
+    # ==== READERS ====
+    def get_current_pitch(self):
+        # Latest analysed pitch that passed the confidence gate; never blocks
+        _, pitches, _, smoothed = self.pitch_stream.latest(1)
+        if len(pitches) == 0 or smoothed[0] <= 0:
+            return 0
+        return float(pitches[0])
+
+    def get_smoothed_pitch(self, until=None):
+        # Smoothed pitch of the newest hop, or of the last hop captured up
+        # to the perf_counter time `until`
+        if until is None:
+            smoothed = self.pitch_stream.latest(1)[3]
+        else:
+            smoothed = self.pitch_stream.before(until, 1)[3]
+        if len(smoothed) == 0:
+            return 0
+        return float(smoothed[0])
+
+    def analysed_until(self):
+        # Capture time of the newest analysed hop (0 before the first one)
+        times = self.pitch_stream.latest(1)[0]
+        return times[0] if len(times) else 0.0
+
+    @property
+    def dropped_frames(self):
+        return self.audio_buffer.dropped_frames
@@ -0,0 +1,104 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+# ==== SETTINGS ====
+CACHE_DIR = ".pitch_cache"             # Where cached pitch tracks live
+CACHE_VERSION = 1                      # Bump when the on-disk layout changes
+HASH_BLOCK = 1 << 20                   # Read size when hashing audio files
+
+# Persistent cache of reference pitch tracks.
+#
+# Each track is stored as a raw float32 .npy file so it can be memory-mapped
+# back in without parsing.  The file name is derived from the audio content
+# hash plus the analysis parameters, so editing the song or changing
+# fmin/fmax/frame/hop length automatically misses the old entry.
+#
+# Hashing a long song is not free, so the content hash is remembered in a
+# small index keyed by (path, size, mtime).  An unchanged file is looked up
+# with a single stat() call.
+class PitchTrackCache:
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.index_path = os.path.join(cache_dir, "index.json")
+        self._index = None
+        self._tracks = {}
+
+    def _load_index(self):
+        if self._index is None:
+            try:
+                with open(self.index_path) as f:
+                    self._index = json.load(f)
+            except (OSError, ValueError):
+                self._index = {}
+        return self._index
+
+    def _save_index(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._index, f)
+        os.replace(tmp_path, self.index_path)
+
+    def content_hash(self, path):
+        index = self._load_index()
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        entry = index.get(path)
+        if entry and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns:
+            return entry["sha1"]
+
+        digest = hashlib.sha1()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(HASH_BLOCK), b""):
+                digest.update(block)
+
+        entry = entry or {}
+        entry.update(size=st.st_size, mtime_ns=st.st_mtime_ns, sha1=digest.hexdigest())
+        index[path] = entry
+        self._save_index()
+        return entry["sha1"]
+
+    def key(self, path, params):
+        params_blob = json.dumps(params, sort_keys=True)
+        blob = f"v{CACHE_VERSION}:{self.content_hash(path)}:{params_blob}"
+        return hashlib.sha1(blob.encode()).hexdigest()
+
+    def get(self, path, params, compute):
+        # Return the pitch track for `path`, running `compute()` only on a miss.
+        # `params` must contain every setting that affects the analysis.
+        key = self.key(path, params)
+        if key in self._tracks:
+            return self._tracks[key]
+
+        cache_file = os.path.join(self.cache_dir, key + ".npy")
+        if not os.path.exists(cache_file):
+            track = np.ascontiguousarray(compute(), dtype=np.float32)
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = cache_file + ".tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, track)
+            os.replace(tmp_path, cache_file)
+            self._forget_stale(path, key)
+
+        track = np.load(cache_file, mmap_mode="r")
+        self._tracks[key] = track
+        return track
+
+    def _forget_stale(self, path, key):
+        # Drop the previous track of this file so the cache does not keep one
+        # entry per edit of the same song.
+        index = self._load_index()
+        entry = index.get(os.path.abspath(path))
+        if entry is None:
+            return
+        old_key = entry.get("track")
+        if old_key and old_key != key:
+            try:
+                os.remove(os.path.join(self.cache_dir, old_key + ".npy"))
+            except OSError:
+                pass
+        entry["track"] = key
+        self._save_index()
@@ -0,0 +1,185 @@
+import math
+
+# ==== SETTINGS ====
+CONFIDENCE_THRESHOLD = 0.8             # Gate threshold until background noise has been measured
+MIN_CONFIDENCE = 0.5                   # The adaptive threshold stays within these bounds
+MAX_CONFIDENCE = 0.95
+NOISE_MARGIN = 2.5                     # Threshold = background confidence mean + this many std devs
+SNR_DB = 10.0                          # Hops quieter than noise floor + this count as background
+NOISE_RISE_DB = 0.5                    # dB per second the noise floor estimate may rise
+WARMUP_HOPS = 20                       # Background hops needed before the threshold adapts
+LEVEL_FLOOR_DB = -120.0                # Quieter hops (digital silence is -inf) are not background
+DEFAULT_FILTERS = "octave,median,euro" # Smoothing stages applied after the gate, in order
+
+# Incremental pitch smoothing for the analysis thread.
+#
+# Each analysed hop goes through a PitchSmoother once: an adaptive
+# confidence gate decides whether the hop is voiced, then a chain of filters
+# cleans up the pitch.  Every stage keeps a few scalars or a fixed-size
+# window, so a hop costs O(1) whatever the session length, and the result is
+# published with the hop instead of being recomputed by every reader.
+#
+# Filters work in MIDI note numbers, so their settings mean the same thing
+# in every register.  Each filter is called as f(t, midi) -> midi and gets
+# None for unvoiced hops, which resets whatever state would otherwise smear
+# one note into the next.
+#
+#   octave - folds sudden jumps of about an octave back, unless they last
+#   median - median of the last few voiced hops; removes single-hop glitches
+#   euro   - one-euro filter: heavy smoothing on held notes, little lag on runs
+
+# ==== GATE ====
+# Confidence threshold that follows the room.  The hop level is tracked with
+# a noise-floor follower (drops at once, rises slowly); hops near the floor
+# are background, and the threshold sits a few standard deviations above the
+# confidence YIN reports for that background.
+class AdaptiveGate:
+    def __init__(self, initial=CONFIDENCE_THRESHOLD, low=MIN_CONFIDENCE, high=MAX_CONFIDENCE):
+        self.initial = initial
+        self.low = low
+        self.high = high
+        self.reset()
+
+    def reset(self):
+        self.threshold = self.initial
+        self.noise_db = None
+        self._last_t = None
+        self._count = 0
+        self._mean = 0.0
+        self._var = 0.0
+
+    def __call__(self, t, confidence, level_db):
+        # True if a hop with this confidence and level counts as sung
+        if not level_db >= LEVEL_FLOOR_DB:
+            # Digital silence (-inf, e.g. an interface's first blocks) or NaN
+            # says nothing about the room, and as a floor it would never rise
+            # back to the real noise; leave the statistics alone
+            return confidence >= self.threshold
+        dt = 0.0 if self._last_t is None else max(t - self._last_t, 0.0)
+        self._last_t = t
+        if self.noise_db is None or level_db < self.noise_db:
+            self.noise_db = level_db
+        else:
+            self.noise_db += NOISE_RISE_DB * dt
+
+        if level_db < self.noise_db + SNR_DB:
+            # Background: update running confidence statistics (EMA)
+            self._count += 1
+            alpha = 1.0 / min(self._count, 100)
+            delta = confidence - self._mean
+            self._mean += alpha * delta
+            self._var = (1 - alpha) * (self._var + alpha * delta * delta)
+            if self._count >= WARMUP_HOPS:
+                threshold = self._mean + NOISE_MARGIN * math.sqrt(self._var)
+                self.threshold = min(max(threshold, self.low), self.high)
+        return confidence >= self.threshold
+
+# ==== FILTERS ====
+class OctaveCorrector:
+    def __init__(self, tolerance=1.0, hold=3):
+        self.tolerance = tolerance     # Semitones around +-12 treated as an octave error
+        self.hold = hold               # Hops a jump must last to be accepted as real
+        self.reset()
+
+    def reset(self):
+        self._last = None
+        self._held = 0
+
+    def __call__(self, t, midi):
+        if midi is None:
+            self.reset()
+            return None
+        if self._last is not None:
+            jump = midi - self._last
+            octaves = round(jump / 12)
+            if octaves and abs(jump - 12 * octaves) < self.tolerance:
+                self._held += 1
+                if self._held < self.hold:
+                    midi -= 12 * octaves
+                    self._last = midi
+                    return midi
+        self._held = 0
+        self._last = midi
+        return midi
+
+class MedianFilter:
+    def __init__(self, size=5):
+        self.size = size
+        self._window = [0.0] * size    # Ring of the last `size` voiced values
+        self.reset()
+
+    def reset(self):
+        self._count = 0
+
+    def __call__(self, t, midi):
+        if midi is None:
+            self.reset()
+            return None
+        self._window[self._count % self.size] = midi
+        self._count += 1
+        n = min(self._count, self.size)
+        return sorted(self._window[:n])[n // 2]
+
+class OneEuroFilter:
+    # Casiez et al.: the cutoff rises with the speed of change, so slow
+    # wobble is smoothed away while fast melodic runs are followed closely
+    def __init__(self, min_cutoff=2.0, beta=0.3, d_cutoff=1.0):
+        self.min_cutoff = min_cutoff   # Hz
+        self.beta = beta               # Extra cutoff per semitone/second of movement
+        self.d_cutoff = d_cutoff
+        self.reset()
+
+    def reset(self):
+        self._x = None
+        self._dx = 0.0
+        self._t = None
+
+    @staticmethod
+    def _alpha(cutoff, dt):
+        tau = 1.0 / (2 * math.pi * cutoff)
+        return 1.0 / (1.0 + tau / dt)
+
+    def __call__(self, t, midi):
+        if midi is None:
+            self.reset()
+            return None
+        if self._x is None or t <= self._t:
+            self._x, self._t = midi, t
+            return midi
+        dt = t - self._t
+        self._t = t
+        dx = (midi - self._x) / dt
+        self._dx += self._alpha(self.d_cutoff, dt) * (dx - self._dx)
+        cutoff = self.min_cutoff + self.beta * abs(self._dx)
+        self._x += self._alpha(cutoff, dt) * (midi - self._x)
+        return self._x
+
+FILTERS = {"octave": OctaveCorrector, "median": MedianFilter, "euro": OneEuroFilter}
+
+def make_filters(spec=DEFAULT_FILTERS):
+    # Filter chain from a comma-separated list of FILTERS names ("" for none)
+    return [FILTERS[name.strip()]() for name in spec.split(",") if name.strip()]
+
+# ==== SMOOTHER ====
+class PitchSmoother:
+    def __init__(self, filters=None, gate=None):
+        self.filters = make_filters() if filters is None else filters
+        self.gate = gate or AdaptiveGate()
+
+    def reset(self):
+        # Between songs.  The gate starts over as well, so every performance
+        # is gated like an offline pitch_track() of its recording
+        self.gate.reset()
+        for f in self.filters:
+            f.reset()
+
+    def __call__(self, t, pitch, confidence, level_db):
+        # Smoothed pitch in Hz for one hop, 0 if it is not sung; `t` is the
+        # audio time of the hop in seconds (not wall-clock time)
+        voiced = self.gate(t, confidence, level_db) and pitch > 0
+        midi = 12 * math.log2(pitch / 440) + 69 if voiced else None
+        for f in self.filters:
+            midi = f(t, midi)
+        if midi is None:
+            return 0.0
+        return 440 * 2 ** ((midi - 69) / 12)
@@ -0,0 +1,55 @@
+import numpy as np
+
+# Timestamped pitch records published by the analysis worker.
+#
+# One writer (the analysis thread) appends (capture_time, pitch, confidence,
+# smoothed pitch) records into preallocated arrays; any number of readers look at them
+# without taking a lock.  `count` is the total number of records ever
+# written and is only bumped after a record is complete, so readers never
+# see a half-written entry.  Old records are overwritten once `capacity` is
+# reached, so memory is fixed for the whole session.
+class PitchStream:
+    def __init__(self, capacity=4096):
+        self.capacity = capacity
+        self.times = np.zeros(capacity, dtype=np.float64)
+        self.pitches = np.zeros(capacity, dtype=np.float32)
+        self.confidences = np.zeros(capacity, dtype=np.float32)
+        self.smoothed = np.zeros(capacity, dtype=np.float32)
+        self.count = 0
+
+    def reset(self):
+        # Only call while the writer is stopped
+        self.count = 0
+
+    def append(self, capture_time, pitch, confidence, smoothed=0.0):
+        i = self.count % self.capacity
+        self.times[i] = capture_time
+        self.pitches[i] = pitch
+        self.confidences[i] = confidence
+        self.smoothed[i] = smoothed
+        self.count += 1
+
+    def _slice(self, start, stop):
+        # Copies of records [start, stop) in write order
+        idx = np.arange(start, stop) % self.capacity
+        return self.times[idx], self.pitches[idx], self.confidences[idx], self.smoothed[idx]
+
+    def latest(self, n):
+        count = self.count
+        start = max(0, count - n, count - self.capacity)
+        return self._slice(start, count)
+
+    def before(self, capture_time, n, lookback=256):
+        # The last `n` records captured at or before `capture_time`, searching
+        # only the newest `lookback` records
+        records = self.latest(lookback)
+        end = int(np.searchsorted(records[0], capture_time, side="right"))
+        start = max(0, end - n)
+        return tuple(column[start:end] for column in records)
+
+    def since(self, cursor):
+        # Records written after `cursor`; returns (times, pitches, confidences, smoothed, new_cursor).
+        # Records that were overwritten before the reader got to them are skipped.
+        count = self.count
+        start = max(cursor, count - self.capacity)
+        return self._slice(start, count) + (count,)
@@ -0,0 +1,73 @@
+import time
+
+import pygame
+
+# Song position derived from the mixer instead of the wall clock.
+#
+# pygame.mixer.music.get_pos() counts the milliseconds the mixer has actually
+# played (loops included), so decoder start-up, buffer underruns and loop
+# gaps do not make the song position drift the way time.time() does.  It
+# only advances once per mixer buffer, so between updates the position is
+# extrapolated with perf_counter, never by more than one buffer.
+#
+# Two latencies are compensated:
+#   output_latency - audio leaves the mixer this long before it is heard
+#   input_latency  - sung audio reaches the capture thread this long after
+#                    it was sung
+# position() is the song time the singer is hearing right now, and
+# capture_time_for() says at which perf_counter timestamp the microphone
+# audio for a given song time comes out of the capture stream.
+class PlaybackClock:
+    def __init__(self, output_latency=0.0, input_latency=0.0, max_extrapolation=0.1):
+        self.output_latency = output_latency
+        self.input_latency = input_latency
+        self.max_extrapolation = max_extrapolation
+        self.running = False
+        self._start = 0.0
+        self._last_pos = -1
+        self._last_change = 0.0
+        self._position = 0.0
+
+    def start(self):
+        self.running = True
+        self._start = time.perf_counter()
+        self._last_pos = -1
+        self._last_change = self._start
+        self._position = 0.0
+
+    def stop(self):
+        self.running = False
+
+    def _mixer_position(self, now):
+        pos_ms = pygame.mixer.music.get_pos()
+        if pos_ms < 0:
+            # Mixer not playing (or no audio device): fall back to wall time
+            return now - self._start
+        if pos_ms != self._last_pos:
+            self._last_pos = pos_ms
+            self._last_change = now
+        return pos_ms / 1000 + min(now - self._last_change, self.max_extrapolation)
+
+    def position(self):
+        # Audible song position in seconds since start(), counting loops
+        if not self.running:
+            return self._position
+        now = time.perf_counter()
+        position = max(0.0, self._mixer_position(now) - self.output_latency)
+        # Never run backwards when get_pos() catches up with the extrapolation
+        self._position = max(self._position, position)
+        return self._position
+
+    def capture_time_for(self, song_time):
+        # perf_counter timestamp at which audio sung at `song_time` was captured
+        now = time.perf_counter()
+        position = self.position()
+        return now - (position - song_time) + self.input_latency
+
+def mixer_output_latency(buffer_size):
+    # Latency added by the mixer's own buffer, from the live mixer settings
+    init = pygame.mixer.get_init()
+    if not init:
+        return 0.0
+    frequency = init[0]
+    return buffer_size / frequency
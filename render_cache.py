@@ -0,0 +1,100 @@
+from collections import OrderedDict
+
+import pygame
+
+# Cache of rendered text surfaces.
+#
+# font.render rasterises the string every time it is called, which is the
+# most expensive part of a frame on slow hardware.  Most of the text on screen
+# (titles, lyrics, labels, instructions) is the same from one frame to the
+# next, so surfaces are kept by (font, text, colour) and the least recently
+# used ones are dropped once `max_size` is reached.
+class TextCache:
+    def __init__(self, max_size=256):
+        self.max_size = max_size
+        self._surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, font, text, color, antialias=True):
+        key = (font, text, tuple(color), antialias)
+        surface = self._surfaces.get(key)
+        if surface is not None:
+            self._surfaces.move_to_end(key)
+            self.hits += 1
+            return surface
+
+        self.misses += 1
+        surface = font.render(text, antialias, color)
+        self._surfaces[key] = surface
+        if len(self._surfaces) > self.max_size:
+            self._surfaces.popitem(last=False)
+        return surface
+
+    def clear(self):
+        self._surfaces.clear()
+
+# Dirty-rectangle frame renderer.
+#
+# Draw calls are recorded into a display list instead of going straight to
+# the screen.  At the end of the frame the list is compared with the previous
+# one: if nothing changed, nothing is drawn or sent to the display at all.
+# Otherwise only the areas covered by last frame's and this frame's commands
+# are cleared, redrawn and passed to pygame.display.update(rects), instead of
+# filling and flipping the whole window.
+class FrameRenderer:
+    def __init__(self, surface, background):
+        self.surface = surface
+        self.background = background
+        self._commands = []
+        self._previous = None
+        self._previous_rects = []
+
+    def invalidate(self):
+        # Force a full repaint on the next present()
+        self._previous = None
+
+    def blit(self, source, dest):
+        self._commands.append(("blit", source, tuple(dest)))
+
+    def rect(self, color, rect, width=0):
+        self._commands.append(("rect", tuple(color), tuple(rect), width))
+
+    def line(self, color, start, end, width=1):
+        self._commands.append(("line", tuple(color), tuple(start), tuple(end), width))
+
+    def lines(self, color, closed, points, width=1):
+        self._commands.append(("lines", tuple(color), closed, tuple(map(tuple, points)), width))
+
+    def circle(self, color, center, radius):
+        self._commands.append(("circle", tuple(color), tuple(center), radius))
+
+    def _execute(self, command):
+        kind = command[0]
+        if kind == "blit":
+            return self.surface.blit(command[1], command[2])
+        if kind == "rect":
+            return pygame.draw.rect(self.surface, command[1], command[2], command[3])
+        if kind == "line":
+            return pygame.draw.line(self.surface, *command[1:])
+        if kind == "lines":
+            return pygame.draw.lines(self.surface, *command[1:])
+        return pygame.draw.circle(self.surface, *command[1:])
+
+    def present(self):
+        commands, self._commands = self._commands, []
+        if self._previous is None:
+            # First frame (or after invalidate): paint everything
+            self.surface.fill(self.background)
+            rects = [self._execute(command) for command in commands]
+            pygame.display.flip()
+        elif commands == self._previous:
+            # Static frame: the screen already shows exactly this
+            return
+        else:
+            for rect in self._previous_rects:
+                self.surface.fill(self.background, rect)
+            rects = [self._execute(command) for command in commands]
+            pygame.display.update(self._previous_rects + rects)
+        self._previous = commands
+        self._previous_rects = rects
@@ -0,0 +1,116 @@
+import numpy as np
+
+# Single-producer / single-consumer ring buffer for float32 audio.
+#
+# The producer (capture thread) only ever advances `write_index` and the
+# consumer only ever advances `read_index`, both as absolute sample counts,
+# so no lock is needed: each side reads the other's counter and writes its
+# own.  Storage is preallocated once, so memory stays constant however long
+# a session runs.
+#
+# Samples are stored twice (at i and i + capacity).  That way any window of
+# up to `capacity` samples is one contiguous slice, and the consumer gets a
+# zero-copy view instead of a concatenated copy.  A view stays valid until
+# the producer has written another `capacity - len(view)` samples.
+#
+# If the consumer falls more than `capacity` samples behind, the oldest audio
+# is overwritten.  The consumer notices on its next read, jumps forward and
+# adds the lost samples to `dropped_frames`.
+class AudioRingBuffer:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._buf = np.zeros(2 * capacity, dtype=np.float32)
+        self.write_index = 0           # Samples ever written (producer only)
+        self.read_index = 0            # Samples consumed or skipped (consumer only)
+        self.dropped_frames = 0        # Samples lost to overruns
+        self.skipped_frames = 0        # Samples passed over by read_latest
+
+    # ==== PRODUCER ====
+    def write(self, samples):
+        # reshape keeps strided 1-D views (one channel of an interleaved
+        # block) as views; they are copied only once, into the buffer
+        samples = np.asarray(samples, dtype=np.float32).reshape(-1)
+        start = self.write_index
+        if len(samples) > self.capacity:
+            start += len(samples) - self.capacity
+            samples = samples[-self.capacity:]
+
+        n = len(samples)
+        pos = start % self.capacity
+        first = min(n, self.capacity - pos)
+        rest = n - first
+        self._buf[pos:pos + first] = samples[:first]
+        self._buf[pos + self.capacity:pos + self.capacity + first] = samples[:first]
+        if rest:
+            self._buf[:rest] = samples[first:]
+            self._buf[self.capacity:self.capacity + rest] = samples[first:]
+
+        # Publish only after the data is in place
+        self.write_index = start + n
+
+    def depth(self):
+        # Unread samples, safe to call from any thread (does not move read_index)
+        return min(self.write_index - self.read_index, self.capacity)
+
+    # ==== CONSUMER ====
+    def _catch_up(self):
+        write_index = self.write_index
+        oldest = write_index - self.capacity
+        if self.read_index < oldest:
+            self.dropped_frames += oldest - self.read_index
+            self.read_index = oldest
+        return write_index
+
+    def available(self):
+        return self._catch_up() - self.read_index
+
+    def _view(self, start, n):
+        pos = start % self.capacity
+        return self._buf[pos:pos + n]
+
+    def read(self, n):
+        # Next `n` unread samples, oldest first, or None if not enough yet
+        write_index = self._catch_up()
+        if write_index - self.read_index < n:
+            return None
+        view = self._view(self.read_index, n)
+        self.read_index += n
+        return view
+
+    def read_latest(self, n):
+        # Newest `n` samples; anything older that was never read is skipped
+        write_index = self._catch_up()
+        if write_index - self.read_index < n:
+            return None
+        start = write_index - n
+        self.skipped_frames += start - self.read_index
+        self.read_index = write_index
+        return self._view(start, n)
+
+# Fixed-capacity history of float values for a single thread.
+#
+# Uses the same mirrored layout as AudioRingBuffer, so latest(n) is always a
+# contiguous zero-copy view, and appending never allocates.
+class HistoryBuffer:
+    def __init__(self, capacity, dtype=np.float64):
+        self.capacity = capacity
+        self._buf = np.zeros(2 * capacity, dtype=dtype)
+        self.count = 0                 # Values ever appended
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def clear(self):
+        self.count = 0
+
+    def append(self, value):
+        pos = self.count % self.capacity
+        self._buf[pos] = value
+        self._buf[pos + self.capacity] = value
+        self.count += 1
+
+    def latest(self, n):
+        # The newest min(n, len(self)) values, oldest first
+        n = min(n, len(self))
+        end = self.count % self.capacity + (self.capacity if self.count >= self.capacity else 0)
+        return self._buf[end - n:end]
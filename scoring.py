@@ -0,0 +1,152 @@
+import argparse
+import json
+import sys
+
+import numpy as np
+
+from contour import hz_to_midi, note_score_midi, score_midi
+from pitch_filters import DEFAULT_FILTERS, PitchSmoother, make_filters
+from songs import example_lyrics, load_lyrics
+from timeline import LyricTimeline
+from yin import level_db, yin
+
+# ==== SETTINGS ====
+BUFFER_SIZE = 1024                     # Samples per pitch hop (same as PitchDetector)
+SILENCE_DB = -40                       # Hops quieter than this get pitch 0
+
+# ==== NOTE SCORING ====
+def note_score(expected_pitch, current_pitch):
+    # Score for one note, or None if the note is not scored (rest or silence).
+    # Within 1 semitone is perfect; see contour.py for the shared rule.
+    return note_score_midi(float(hz_to_midi(expected_pitch)), float(hz_to_midi(current_pitch)))
+
+# ==== PITCH TRACK ====
+def load_wav(path, mono=True):
+    # Float32 samples in [-1, 1] plus the sample rate; with mono=False
+    # multi-channel files keep shape (frames, channels).  SciPy is imported
+    # here, so the game does not pay for it at startup
+    import scipy.io.wavfile as wav
+    sample_rate, data = wav.read(path)
+    if data.dtype.kind == "i":
+        data = data.astype(np.float32) / np.iinfo(data.dtype).max
+    elif data.dtype.kind == "u":
+        data = (data.astype(np.float32) - 128) / 128
+    data = np.asarray(data, dtype=np.float32)
+    if data.ndim > 1 and mono:
+        data = data.mean(axis=1)
+    return data, sample_rate
+
+def analyse_hops(hops, sample_rate):
+    # (pitch, confidence, level in dB) of each row of `hops` (see yin.py);
+    # hops quieter than SILENCE_DB get pitch 0
+    pitches, confidences = yin(hops, sample_rate)
+    levels = level_db(hops)
+    pitches[levels < SILENCE_DB] = 0
+    return pitches, confidences, levels
+
+def pitch_track(samples, sample_rate, buffer_size=BUFFER_SIZE, filters=DEFAULT_FILTERS):
+    # Run YIN and the smoother over every hop, exactly like the live
+    # PitchAnalyser.  Times are the end of each hop, relative to the start of
+    # the recording.  Returns (times, pitches, confidences, smoothed).
+    n_hops = len(samples) // buffer_size
+    times = (np.arange(n_hops) + 1) * buffer_size / sample_rate
+    hops = np.asarray(samples[:n_hops * buffer_size], dtype=np.float32).reshape(n_hops, buffer_size)
+    pitches, confidences, levels = analyse_hops(hops, sample_rate)
+    smoothed = np.zeros(n_hops, dtype=np.float32)
+    smoother = PitchSmoother(make_filters(filters))
+    for i in range(n_hops):
+        smoothed[i] = smoother(times[i], pitches[i], confidences[i], levels[i])
+    return times, pitches, confidences, smoothed
+
+# ==== SCORING ====
+class ScoreResult:
+    def __init__(self):
+        self.notes = []  # (time, lyric, expected_pitch, sung_pitch, score or None)
+        self.score = 0
+        self.max_score = 0
+
+    @property
+    def percent(self):
+        if self.max_score > 0:
+            return (self.score / self.max_score) * 100
+        return 0
+
+    def to_dict(self):
+        return {
+            "score": self.score,
+            "max_score": self.max_score,
+            "percent": self.percent,
+            "notes": [
+                {"time": t, "lyric": lyric, "expected": expected, "sung": sung, "score": score}
+                for t, lyric, expected, sung, score in self.notes
+            ],
+        }
+
+def note_times(lyrics_data, length, duration=0):
+    # Start times, lyric indices and expected pitches of every note the game
+    # reaches in a recording of `length` seconds, in time order.  The
+    # schedule comes from the game's LyricTimeline, so with a duration the
+    # lyrics loop exactly as in the game and lyrics at or after the end of
+    # the audio are never reached.
+    timeline = LyricTimeline(lyrics_data, duration)
+    if timeline.notes_per_loop == 0:
+        return np.zeros(0), np.zeros(0, dtype=np.int64), np.zeros(0)
+    counts = np.arange(timeline.notes_reached(length))
+    index = timeline.note_index(counts)
+    return timeline.note_time(counts), timeline.order[index], timeline.pitches[index]
+
+def score_notes(expected, sung):
+    # Vectorised note_score(); unscored notes get -1
+    return score_midi(hz_to_midi(expected), hz_to_midi(sung))
+
+def note_columns(lyrics_data, times, smoothed, duration=0):
+    # Per-note arrays (start, lyric index, expected Hz, sung Hz, score or -1)
+    length = times[-1] if len(times) else 0
+    starts, index, expected = note_times(lyrics_data, length, duration)
+    # Same as the game: the smoothed pitch of the last hop before the note starts
+    ends = np.searchsorted(times, starts, side="right")
+    sung = np.where(ends > 0, smoothed[np.maximum(ends - 1, 0)], 0.0) if len(times) else np.zeros(len(starts))
+    return starts, index, expected, sung, score_notes(expected, sung)
+
+def score_pitch_track(lyrics_data, times, smoothed, duration=0):
+    starts, index, _, sung, scores = note_columns(lyrics_data, times, smoothed, duration)
+
+    result = ScoreResult()
+    scored = scores >= 0
+    result.score = int(scores[scored].sum())
+    result.max_score = 100 * int(scored.sum())
+    for t, i, sung_pitch, score in zip(starts, index, sung, scores):
+        _, lyric, expected_pitch = lyrics_data[i]
+        result.notes.append((float(t), lyric, expected_pitch, float(sung_pitch),
+                             int(score) if score >= 0 else None))
+    return result
+
+def score_recording(lyrics_data, path, duration=0, buffer_size=BUFFER_SIZE):
+    samples, sample_rate = load_wav(path)
+    times, _, _, smoothed = pitch_track(samples, sample_rate, buffer_size)
+    return score_pitch_track(lyrics_data, times, smoothed, duration)
+
+# ==== COMMAND LINE ====
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score a recorded performance without the game")
+    parser.add_argument("recording", help="WAV file of the performance")
+    parser.add_argument("--lyrics", help="JSON lyric file (defaults to the example song)")
+    parser.add_argument("--duration", type=float, default=0,
+                        help="Song length in seconds; loops the lyrics like the game does")
+    parser.add_argument("--json", action="store_true", help="Print the full result as JSON")
+    args = parser.parse_args(argv)
+
+    lyrics_data = load_lyrics(args.lyrics) if args.lyrics else example_lyrics
+    result = score_recording(lyrics_data, args.recording, args.duration)
+
+    if args.json:
+        json.dump(result.to_dict(), sys.stdout, indent=1)
+        print()
+    else:
+        for t, lyric, expected, sung, score in result.notes:
+            shown = "-" if score is None else score
+            print(f"{t:7.2f}s  {lyric:<24} expected {expected:6.1f} Hz  sung {sung:6.1f} Hz  {shown}")
+        print(f"Score: {result.percent:.1f}% ({result.score}/{result.max_score})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+import wave
+
+import numpy as np
+
+from scoring import load_wav, pitch_track, score_pitch_track
+
+# ==== SETTINGS ====
+SESSIONS_DIR = "sessions"              # One sub-directory per recorded performance
+POLL_INTERVAL = 0.2                    # Seconds between pitch-stream reads on the writer thread
+
+# Recorded performances, for dispute resolution and reproducing bugs.
+#
+# A session directory holds:
+#   audio-<n>.wav  - everything capture source n delivered, as int16 PCM
+#   session.npz    - the song, the timestamped pitch track of every singer
+#                    and every scored note (compressed NumPy arrays)
+# All times in session.npz are song times in seconds, counting loops.
+#
+# The capture callback only copies each block into a queue and the game
+# loop only appends to lists; converting, writing and compressing all
+# happen on the recorder's writer thread, so recording adds no work that
+# can stall audio or a frame.
+
+# ==== RECORDING ====
+class SessionRecorder:
+    def __init__(self, path, capture, song, origin):
+        # `origin` is the perf_counter time at which song time 0 was captured
+        self.path = path
+        self.capture = capture
+        self.song = song
+        self.origin = origin
+        self.notes = []                # (singer, time, lyric index, expected Hz, sung Hz, score)
+        self._blocks = queue.Queue()
+        self._sinks = []
+
+        os.makedirs(path, exist_ok=True)
+        self._wavs = []
+        self._audio_start = []
+        for n, source in enumerate(capture.sources):
+            w = wave.open(os.path.join(path, f"audio-{n}.wav"), "wb")
+            w.setnchannels(source.channels)
+            w.setsampwidth(2)
+            w.setframerate(source.sample_rate)
+            self._wavs.append(w)
+            self._audio_start.append(None)
+            sink = self._make_sink(n)
+            source.add_sink(sink)
+            self._sinks.append((source, sink))
+
+        self._cursors = [0] * len(capture.detectors)
+        self._pitch = [[] for _ in capture.detectors]
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def start(cls, capture, song, origin, sessions_dir=SESSIONS_DIR):
+        name = time.strftime("%Y%m%d-%H%M%S") + f"-{time.time_ns() % 1000000:06d}"
+        return cls(os.path.join(sessions_dir, name), capture, song, origin)
+
+    def _make_sink(self, n):
+        sample_rate = self.capture.sources[n].sample_rate
+        def sink(block, captured_at):
+            if self._audio_start[n] is None:
+                self._audio_start[n] = captured_at - len(block) / sample_rate
+            self._blocks.put((n, block.copy()))
+        return sink
+
+    def note(self, singer, note_time, lyric_index, expected, sung, score):
+        # Called from the game loop for every note scored
+        self.notes.append((singer, note_time, lyric_index, expected, sung,
+                           -1 if score is None else score))
+
+    def finish(self):
+        # Stop recording; the files are completed on the writer thread
+        for source, sink in self._sinks:
+            source.remove_sink(sink)
+        self._blocks.put(None)
+
+    def join(self, timeout=None):
+        self._thread.join(timeout)
+
+    # ==== WRITER THREAD ====
+    def _read_pitch(self):
+        for i, detector in enumerate(self.capture.detectors):
+            times, pitches, confidences, smoothed, self._cursors[i] = \
+                detector.pitch_stream.since(self._cursors[i])
+            if len(times):
+                self._pitch[i].append((times - self.origin, pitches, confidences, smoothed))
+
+    def _run(self):
+        while True:
+            try:
+                item = self._blocks.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                item = ()
+            if item is None:
+                break
+            if item:
+                n, block = item
+                pcm = (np.clip(block, -1, 1) * 32767).astype("<i2")
+                self._wavs[n].writeframes(pcm.tobytes())
+            self._read_pitch()
+        self._read_pitch()
+        for w in self._wavs:
+            w.close()
+        self._write_container()
+
+    def _write_container(self):
+        singers, times, pitches, confidences, smoothed = [], [], [], [], []
+        for i, chunks in enumerate(self._pitch):
+            for t, p, c, s in chunks:
+                singers.append(np.full(len(t), i, dtype=np.int8))
+                times.append(t)
+                pitches.append(p)
+                confidences.append(c)
+                smoothed.append(s)
+        cat = lambda arrays, dtype: np.concatenate(arrays).astype(dtype) if arrays else np.zeros(0, dtype)
+        notes = np.array(self.notes, dtype=np.float64).reshape(-1, 6)
+
+        meta = {
+            "title": self.song.title,
+            "audio_file": self.song.audio_file,
+            "duration": self.song.duration,
+            "lyrics": [list(entry) for entry in self.song.lyrics_data],
+            "recorded": time.time(),
+            "singers": len(self.capture.detectors),
+            # Route of each singer: (audio file index, channel)
+            "routes": self.capture.routes,
+            # Song time of the first sample of each audio file
+            "audio_offsets": [None if start is None else start - self.origin for start in self._audio_start],
+        }
+        tmp_path = os.path.join(self.path, "session.tmp.npz")
+        np.savez_compressed(
+            tmp_path,
+            meta=np.array(json.dumps(meta)),
+            pitch_singer=cat(singers, np.int8),
+            pitch_time=cat(times, np.float64),
+            pitch_hz=cat(pitches, np.float32),
+            pitch_confidence=cat(confidences, np.float32),
+            pitch_smoothed=cat(smoothed, np.float32),
+            note_singer=notes[:, 0].astype(np.int8),
+            note_time=notes[:, 1],
+            note_lyric=notes[:, 2].astype(np.int32),
+            note_expected=notes[:, 3].astype(np.float32),
+            note_sung=notes[:, 4].astype(np.float32),
+            note_score=notes[:, 5].astype(np.int8),
+        )
+        os.replace(tmp_path, os.path.join(self.path, "session.npz"))
+
+# ==== REPLAY ====
+# Song clock for a recording replayed through the game by a FileSource, so
+# the game scores the replayed audio at the song times it was sung at.
+# `offset` is the song time of the file's first sample.
+class ReplayClock:
+    def __init__(self, source, offset=0.0, speed=1.0):
+        self.source = source
+        self.offset = offset
+        self.speed = speed
+        self.running = False
+
+    def start(self):
+        self.running = True
+
+    def stop(self):
+        self.running = False
+
+    def position(self):
+        if self.source.started_at is None:
+            return self.offset
+        return self.offset + (time.perf_counter() - self.source.started_at) * self.speed
+
+    def capture_time_for(self, song_time):
+        started_at = self.source.started_at or time.perf_counter()
+        return started_at + (song_time - self.offset) / self.speed
+
+# ==== READING ====
+class Session:
+    def __init__(self, path):
+        self.path = path
+        with np.load(os.path.join(path, "session.npz")) as data:
+            self.meta = json.loads(str(data["meta"]))
+            self.arrays = {name: data[name] for name in data.files if name != "meta"}
+        self.lyrics = [tuple(entry) for entry in self.meta["lyrics"]]
+
+    def audio_path(self, n):
+        return os.path.join(self.path, f"audio-{n}.wav")
+
+    def singer_audio(self, singer):
+        # (mono samples, sample rate, song time of the first sample)
+        n, channel = self.meta["routes"][singer]
+        samples, sample_rate = load_wav(self.audio_path(n), mono=False)
+        if samples.ndim > 1:
+            samples = samples[:, channel]
+        return samples, sample_rate, self.meta["audio_offsets"][n] or 0.0
+
+    def recorded_scores(self, singer):
+        a = self.arrays
+        mine = a["note_singer"] == singer
+        return a["note_time"][mine], a["note_score"][mine]
+
+    def rescore(self, singer):
+        # Score the recorded audio again with the offline scorer; decoding and
+        # analysis run as fast as the CPU allows
+        samples, sample_rate, offset = self.singer_audio(singer)
+        times, _, _, smoothed = pitch_track(samples, sample_rate)
+        return score_pitch_track(self.lyrics, times + offset, smoothed, self.meta["duration"])
+
+# ==== COMMAND LINE ====
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect and re-score recorded sessions")
+    parser.add_argument("session", help="Session directory")
+    parser.add_argument("--notes", action="store_true", help="List every note, recorded vs re-scored")
+    args = parser.parse_args(argv)
+
+    session = Session(args.session)
+    print(f"{session.meta['title']}  ({session.meta['singers']} singer(s))")
+    for singer in range(session.meta["singers"]):
+        start = time.perf_counter()
+        result = session.rescore(singer)
+        elapsed = time.perf_counter() - start
+        note_times, scores = session.recorded_scores(singer)
+        scored = scores >= 0
+        recorded = 100 * scores[scored].sum() / (100 * scored.sum()) if scored.any() else 0
+        print(f"P{singer + 1}: recorded {recorded:.1f}%  re-scored {result.percent:.1f}%  ({elapsed:.2f}s)")
+        if args.notes:
+            # Both scorers put a note at the same song time
+            offline = {round(note[0], 6): note[4] for note in result.notes}
+            for t, score in zip(note_times, scores):
+                shown = "-" if score < 0 else score
+                again = offline.get(round(float(t), 6))
+                print(f"  {t:8.2f}s  game {shown!s:>3}  offline {'-' if again is None else again!s:>3}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+import io
+import json
+import os
+import struct
+import threading
+import wave
+
+# ==== SETTINGS ====
+METADATA_INDEX = ".song_metadata.json" # Cached durations, keyed by path
+HEADER_BYTES = 64 * 1024               # Enough to find the first MP3 frame after most tags
+
+# Song metadata read from file headers instead of decoding the audio.
+#
+# Decoding a whole MP3 just to learn its length costs hundreds of MB and
+# seconds on long tracks.  The formats the game plays all carry enough in
+# their headers to compute the duration: the WAV header, the Xing/VBRI
+# frame count of a VBR MP3 (or the bitrate of a CBR one), and the last Ogg
+# page's granule position.  Results are remembered per (path, size, mtime)
+# so a known song costs one stat() call.
+
+# ==== MP3 ====
+MP3_BITRATES = {
+    (1, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (1, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (1, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (2, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (2, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (2, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+MP3_SAMPLE_RATES = {1: [44100, 48000, 32000], 2: [22050, 24000, 16000], 2.5: [11025, 12000, 8000]}
+
+def _mp3_frame_header(data, pos):
+    # Parsed MPEG audio frame header at `pos`, or None if there is no valid one
+    if pos + 4 > len(data) or data[pos] != 0xFF or (data[pos + 1] & 0xE0) != 0xE0:
+        return None
+    b1, b2, b3 = data[pos + 1], data[pos + 2], data[pos + 3]
+    version = {3: 1, 2: 2, 0: 2.5}.get((b1 >> 3) & 3)
+    layer = {3: 1, 2: 2, 1: 3}.get((b1 >> 1) & 3)
+    bitrate_index = b2 >> 4
+    rate_index = (b2 >> 2) & 3
+    if version is None or layer is None or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    table_version = 1 if version == 1 else 2
+    if layer == 1:
+        samples = 384
+    elif layer == 3 and version != 1:
+        samples = 576
+    else:
+        samples = 1152
+    return {
+        "version": version,
+        "layer": layer,
+        "bitrate": MP3_BITRATES[(table_version, layer)][bitrate_index] * 1000,
+        "sample_rate": MP3_SAMPLE_RATES[version][rate_index],
+        "samples_per_frame": samples,
+        "mono": (b3 >> 6) == 3,
+    }
+
+def mp3_duration(path):
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        data = f.read(HEADER_BYTES)
+        start = 0
+        if data[:3] == b"ID3":
+            # Skip the ID3v2 tag (syncsafe size, optional footer)
+            tag_size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+            start = 10 + tag_size + (10 if data[5] & 0x10 else 0)
+            if start + 4 > len(data):
+                f.seek(start)
+                data = f.read(HEADER_BYTES)
+                size -= start
+                start = 0
+        f.seek(max(0, os.path.getsize(path) - 128))
+        has_id3v1 = f.read(3) == b"TAG"
+
+    pos = start
+    header = None
+    while pos < len(data) - 4:
+        header = _mp3_frame_header(data, pos)
+        if header:
+            break
+        pos += 1
+    if header is None:
+        raise ValueError(f"no MPEG audio frame found in {path}")
+
+    # VBR files announce their frame count in a Xing/Info or VBRI header
+    if header["version"] == 1:
+        side_info = 17 if header["mono"] else 32
+    else:
+        side_info = 9 if header["mono"] else 17
+    xing = pos + 4 + side_info
+    if data[xing:xing + 4] in (b"Xing", b"Info"):
+        flags = struct.unpack(">I", data[xing + 4:xing + 8])[0]
+        if flags & 1:
+            frames = struct.unpack(">I", data[xing + 8:xing + 12])[0]
+            return frames * header["samples_per_frame"] / header["sample_rate"], header["sample_rate"]
+    vbri = pos + 4 + 32
+    if data[vbri:vbri + 4] == b"VBRI":
+        frames = struct.unpack(">I", data[vbri + 14:vbri + 18])[0]
+        return frames * header["samples_per_frame"] / header["sample_rate"], header["sample_rate"]
+
+    # Constant bitrate: audio bytes / bytes per second
+    audio_bytes = size - pos - (128 if has_id3v1 else 0)
+    return audio_bytes * 8 / header["bitrate"], header["sample_rate"]
+
+# ==== OTHER FORMATS ====
+def wav_duration(path):
+    with wave.open(path, "rb") as w:
+        return w.getnframes() / w.getframerate(), w.getframerate()
+
+def ogg_duration(path):
+    with open(path, "rb") as f:
+        head = f.read(HEADER_BYTES)
+        ident = head.find(b"\x01vorbis")
+        if ident < 0:
+            raise ValueError(f"not an Ogg Vorbis file: {path}")
+        sample_rate = struct.unpack("<I", head[ident + 12:ident + 16])[0]
+        # The granule position of the last page is the total sample count
+        f.seek(max(0, os.path.getsize(path) - HEADER_BYTES))
+        tail = f.read()
+    page = tail.rfind(b"OggS")
+    if page < 0:
+        raise ValueError(f"no Ogg page found at the end of {path}")
+    granule = struct.unpack("<q", tail[page + 6:page + 14])[0]
+    return granule / sample_rate, sample_rate
+
+PROBES = {".mp3": mp3_duration, ".wav": wav_duration, ".ogg": ogg_duration}
+
+def probe_duration(path):
+    # (duration seconds, sample rate) from the file headers; raises OSError
+    # if the file cannot be read and ValueError if the headers cannot be used
+    probe = PROBES.get(os.path.splitext(path)[1].lower())
+    if probe is None:
+        raise ValueError(f"unsupported audio format: {path}")
+    try:
+        return probe(path)
+    except (wave.Error, EOFError, struct.error, IndexError, ZeroDivisionError) as e:
+        # Truncated or damaged headers, or an encoding the probe does not
+        # know (e.g. float WAV)
+        raise ValueError(f"unreadable header in {path}: {e}") from e
+
+# ==== METADATA CACHE ====
+class SongMetadataCache:
+    def __init__(self, index_path=METADATA_INDEX):
+        self.index_path = index_path
+        self._index = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._index is None:
+            try:
+                with open(self.index_path) as f:
+                    self._index = json.load(f)
+            except (OSError, ValueError):
+                self._index = {}
+        return self._index
+
+    def _save(self):
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._index, f)
+        os.replace(tmp_path, self.index_path)
+
+    def get(self, path):
+        # Cached metadata dict for `path`, probing the headers if it changed
+        key = os.path.abspath(path)
+        st = os.stat(key)
+        with self._lock:
+            entry = self._load().get(key)
+            if entry and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns:
+                return entry
+
+        duration, sample_rate = probe_duration(path)
+        entry = {"size": st.st_size, "mtime_ns": st.st_mtime_ns,
+                 "duration": duration, "sample_rate": sample_rate}
+        with self._lock:
+            self._load()[key] = entry
+            self._save()
+        return entry
+
+metadata_cache = SongMetadataCache()
+
+# ==== PRELOADING ====
+# Prepares one song in the background: reads the compressed file into memory
+# (so the mixer can start streaming it without touching the disk) and fills
+# in its metadata and timeline.  Only the most recently requested song is
+# kept, so at most one extra compressed file is held in memory.
+class SongPreloader:
+    def __init__(self, prepare):
+        self.prepare = prepare         # Called as prepare(song) on the worker thread
+        self._lock = threading.Lock()
+        self._wanted = None
+        self._ready = None             # (song, compressed file contents)
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def request(self, song):
+        with self._lock:
+            if self._ready is not None and self._ready[0] is song:
+                return
+            self._wanted = song
+        self._wake.set()
+
+    def take(self, song):
+        # The preloaded file contents for `song`, or None if it is not ready
+        with self._lock:
+            if self._ready is not None and self._ready[0] is song:
+                return io.BytesIO(self._ready[1])
+        return None
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            with self._lock:
+                song, self._wanted = self._wanted, None
+            if song is None:
+                continue
+            try:
+                self.prepare(song)
+                with open(song.audio_file, "rb") as f:
+                    data = f.read()
+            except Exception as e:
+                print(f"Error preloading {song.audio_file}: {e}")
+                continue
+            with self._lock:
+                self._ready = (song, data)
@@ -0,0 +1,22 @@
+import json
+
+# Example song data
+# In a real game, this would be loaded from files
+example_lyrics = [
+    (1.0, "Example lyrics 1", 220.0),  # Timestamp, Lyrics, Expected pitch (Hz)
+    (3.5, "Example lyrics 2", 246.9),
+    (5.0, "Example lyrics 3", 261.6),
+    (8.0, "Example lyrics 4", 293.7),
+    (10.0, "Example lyrics 5", 329.6),
+    (12.0, "Example lyrics 6", 349.2),
+    (14.0, "Example lyrics 7", 392.0),
+]
+
+def load_lyrics(path):
+    # Lyric files are JSON lists of [timestamp, lyric, expected_pitch_hz]
+    with open(path) as f:
+        return [(float(t), str(lyric), float(pitch)) for t, lyric, pitch in json.load(f)]
+
+def save_lyrics(path, lyrics_data):
+    with open(path, "w") as f:
+        json.dump([list(entry) for entry in lyrics_data], f, indent=1)
@@ -0,0 +1,232 @@
+import argparse
+import math
+import os
+import struct
+import threading
+import time
+
+# ==== SETTINGS ====
+BAUDRATE = 115200
+WRITE_TIMEOUT = 0.05                   # Seconds a write may block before the frame is dropped
+RECONNECT_INTERVAL = 2.0               # Seconds between attempts to reopen a lost port
+KEEPALIVE = 1.0                        # Resend an unchanged state this often, for displays that reset
+
+# Serial output for stage hardware (LED pitch bars, score displays).
+#
+# The game hands StageOutput the state it shows on screen once per frame.
+# That only encodes a frame and swaps it into a single slot; a writer thread
+# owns the port and sends whatever is in the slot when the port is free.  If
+# the link is slower than the frame rate, newer states replace older unsent
+# ones (coalescing), so the hardware always gets the latest state and the
+# queue never grows.  Writes time out after WRITE_TIMEOUT, and a port that
+# fails is closed and reopened every RECONNECT_INTERVAL, all on the writer
+# thread, so a slow, full or unplugged port can never stall the game.
+#
+# Wire format (little-endian), one frame per state:
+#
+#   0xA5  type  length  payload[length]  checksum
+#
+# checksum makes type + length + payload + checksum sum to 0 mod 256.
+# Receivers resynchronise by scanning for 0xA5 and checking the length (at
+# most MAX_PAYLOAD) and the checksum.
+#
+# STATE (type 0x01) payload:
+#   u8   game state: 0 menu, 1 playing, 2 results
+#   u16  expected pitch on the meter scale: 0 none, 1..65535 bottom..top
+#   u8   singer count n (at most MAX_SINGERS; further singers are not sent)
+#   n x (u16 sung pitch, same scale; u16 score in tenths of a percent)
+
+SYNC = 0xA5
+STATE = 0x01
+MAX_SINGERS = 8
+MAX_PAYLOAD = 4 + 4 * MAX_SINGERS      # A STATE with every singer
+GAME_STATES = {"menu": 0, "playing": 1, "results": 2}
+
+# ==== FRAMING ====
+def encode_frame(kind, payload):
+    header = bytes((kind, len(payload)))
+    checksum = -sum(header + payload) & 0xFF
+    return bytes((SYNC,)) + header + payload + bytes((checksum,))
+
+def _scale(unit):
+    # 0..1 meter position (NaN for none) to the u16 wire value
+    if unit is None or math.isnan(unit):
+        return 0
+    return 1 + int(round(min(max(unit, 0.0), 1.0) * 65534))
+
+def encode_state(game_state, expected, pitches, percents):
+    # `expected` and `pitches` are meter positions (0..1, NaN for silence);
+    # only the first MAX_SINGERS singers are encoded
+    pitches, percents = list(pitches)[:MAX_SINGERS], list(percents)[:MAX_SINGERS]
+    payload = struct.pack("<BHB", GAME_STATES[game_state], _scale(expected), len(pitches))
+    for unit, percent in zip(pitches, percents):
+        payload += struct.pack("<HH", _scale(unit), int(round(min(max(percent, 0), 100) * 10)))
+    return encode_frame(STATE, payload)
+
+class FrameDecoder:
+    # Reference receiver: feed() bytes as they arrive, get complete frames
+    def __init__(self):
+        self._buf = bytearray()
+        self.bad_frames = 0
+
+    def feed(self, data):
+        # [(type, payload)] of the valid frames completed by `data`
+        self._buf += data
+        frames = []
+        while True:
+            start = self._buf.find(SYNC)
+            if start < 0:
+                self._buf.clear()
+                break
+            del self._buf[:start]
+            if len(self._buf) < 3:
+                break
+            length = self._buf[2]
+            if length <= MAX_PAYLOAD and len(self._buf) < 4 + length:
+                break
+            frame = bytes(self._buf[1:4 + length])
+            if length > MAX_PAYLOAD or sum(frame) & 0xFF:
+                # Not a frame boundary after all; look for the next sync byte
+                self.bad_frames += 1
+                del self._buf[:1]
+                continue
+            frames.append((frame[0], frame[2:-1]))
+            del self._buf[:4 + length]
+        return frames
+
+def decode_state(payload):
+    # (game state name, expected, [(pitch, percent)]); pitches as 0..1 or None
+    state, expected, count = struct.unpack_from("<BHB", payload)
+    names = {v: k for k, v in GAME_STATES.items()}
+    unit = lambda value: None if value == 0 else (value - 1) / 65534
+    singers = [struct.unpack_from("<HH", payload, 4 + 4 * i) for i in range(count)]
+    return names[state], unit(expected), [(unit(p), s / 10) for p, s in singers]
+
+# ==== OUTPUT ====
+class StageOutput:
+    def __init__(self, port, baudrate=BAUDRATE):
+        self.port = port               # Device path or pyserial URL (e.g. loop://)
+        self.baudrate = baudrate
+        self.connected = False
+        self.sent = 0                  # Frames written
+        self.coalesced = 0             # Frames replaced by a newer one before sending
+        self.timeouts = 0              # Frames dropped because the port was full
+        self.errors = 0                # Port failures (open or write)
+        self._lock = threading.Lock()  # Guards the slot only, never held during I/O
+        self._pending = None
+        self._wake = threading.Event()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def send_state(self, game_state, expected, pitches, percents):
+        self.send(encode_state(game_state, expected, pitches, percents))
+
+    def send(self, frame):
+        # Never blocks on the port; called from the game loop
+        with self._lock:
+            if self._pending is not None:
+                self.coalesced += 1
+            self._pending = frame
+        self._wake.set()
+
+    def close(self, timeout=1.0):
+        self._running = False
+        self._wake.set()
+        self._thread.join(timeout)
+
+    # ==== WRITER THREAD ====
+    def _open(self):
+        # Imported here so the game runs without pyserial unless this is used
+        import serial
+        return serial.serial_for_url(self.port, baudrate=self.baudrate, timeout=0,
+                                     write_timeout=WRITE_TIMEOUT)
+
+    def _run(self):
+        import serial
+        link = None
+        last_frame = None
+        last_write = 0.0
+        next_open = 0.0
+        while self._running:
+            self._wake.wait(KEEPALIVE)
+            self._wake.clear()
+            with self._lock:
+                frame, self._pending = self._pending, None
+            now = time.monotonic()
+            if frame is None or frame == last_frame:
+                if last_frame is None or now - last_write < KEEPALIVE:
+                    continue
+                frame = last_frame
+
+            if link is None:
+                if now < next_open:
+                    continue
+                try:
+                    link = self._open()
+                    self.connected = True
+                except (serial.SerialException, OSError, ValueError):
+                    self.errors += 1
+                    next_open = now + RECONNECT_INTERVAL
+                    continue
+            try:
+                link.write(frame)
+                self.sent += 1
+                last_frame = frame
+                last_write = now
+            except serial.SerialTimeoutException:
+                # The port cannot keep up; the next state replaces this one
+                self.timeouts += 1
+            except (serial.SerialException, OSError):
+                self.errors += 1
+                self.connected = False
+                try:
+                    link.close()
+                except (serial.SerialException, OSError):
+                    pass
+                link = None
+                next_open = now + RECONNECT_INTERVAL
+        if link is not None:
+            link.close()
+        self.connected = False
+
+# ==== COMMAND LINE ====
+def monitor(read, out=print):
+    # Print every state read with read(), which returns bytes or None at the end
+    decoder = FrameDecoder()
+    while True:
+        data = read()
+        if data is None:
+            break
+        for kind, payload in decoder.feed(data):
+            if kind == STATE:
+                state, expected, singers = decode_state(payload)
+                parts = [f"{p if p is None else round(p, 3)}/{s:.1f}%" for p, s in singers]
+                out(f"{state:8s} expected {expected if expected is None else round(expected, 3)}  " + "  ".join(parts))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Decode the game's stage output")
+    parser.add_argument("port", nargs="?", help="Serial port to monitor")
+    parser.add_argument("--pty", action="store_true",
+                        help="Create a pseudo-terminal to stand in for the hardware and monitor it")
+    parser.add_argument("--baudrate", type=int, default=BAUDRATE)
+    args = parser.parse_args(argv)
+
+    if args.pty:
+        master, slave = os.openpty()
+        print(f"Run the game with --stage {os.ttyname(slave)}")
+        def read():
+            try:
+                return os.read(master, 1024)
+            except OSError:
+                return None
+        monitor(read)
+    elif args.port:
+        import serial
+        with serial.serial_for_url(args.port, baudrate=args.baudrate, timeout=1) as link:
+            monitor(lambda: link.read(1024))
+    else:
+        parser.error("give a port or --pty")
+
+if __name__ == "__main__":
+    main()
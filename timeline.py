@@ -0,0 +1,74 @@
+import numpy as np
+
+from contour import hz_to_midi
+
+# Compiled lyric/pitch timeline for one song.
+#
+# Built once when a song is loaded from its (timestamp, lyric, pitch) tuples.
+# Timestamps live in a sorted NumPy array, so "what is active at t" and
+# "what comes next" are a binary search instead of a scan over every lyric.
+#
+# Looping is handled with absolute note counts: with n notes reachable per
+# loop, the k-th note ever reached is lyric k % n of loop k // n.  Comparing
+# the count at two song positions tells exactly which notes were passed in
+# between, even across a loop boundary or a long frame.
+class LyricTimeline:
+    def __init__(self, lyrics_data, duration=0):
+        order = sorted(range(len(lyrics_data)), key=lambda i: lyrics_data[i][0])
+        # Position in lyrics_data of each timeline entry
+        self.order = np.array(order, dtype=np.int64)
+        self.times = np.array([lyrics_data[i][0] for i in order], dtype=np.float64)
+        self.lyrics = [lyrics_data[i][1] for i in order]
+        self.pitches = np.array([lyrics_data[i][2] for i in order], dtype=np.float64)
+        # Reference pitch of each lyric in MIDI notes (NaN for rests), converted once
+        self.midi = hz_to_midi(self.pitches)
+        self.duration = duration
+        # Notes at or past the end of the audio are never reached while looping
+        if duration > 0:
+            self.notes_per_loop = int(np.searchsorted(self.times, duration, side="left"))
+        else:
+            self.notes_per_loop = len(self.times)
+
+    def __len__(self):
+        return len(self.times)
+
+    def wrap(self, total_time):
+        # (loop number, time within the loop) for a position since the start
+        if self.duration > 0:
+            return int(total_time // self.duration), total_time % self.duration
+        return 0, total_time
+
+    def index_at(self, loop_time):
+        # Index of the lyric active at `loop_time`, or -1 before the first one
+        return int(np.searchsorted(self.times, loop_time, side="right")) - 1
+
+    def next_index(self, index):
+        # The lyric after `index`; after the last one the song loops to the first
+        return (index + 1) % len(self.times)
+
+    def current_and_next(self, loop_time):
+        index = self.index_at(loop_time)
+        if index < 0:
+            return "", ""
+        return self.lyrics[index], self.lyrics[self.next_index(index)]
+
+    def expected_pitch(self, loop_time):
+        index = self.index_at(loop_time)
+        if index < 0:
+            return 0
+        return self.pitches[index]
+
+    def notes_reached(self, total_time):
+        # How many notes have started since the song began, counting loops
+        loop, loop_time = self.wrap(total_time)
+        return loop * self.notes_per_loop + self.index_at(loop_time) + 1
+
+    def note_index(self, count):
+        # Lyric index of the `count`-th note reached (0-based); like
+        # note_time(), also takes an array of counts
+        return count % self.notes_per_loop
+
+    def note_time(self, count):
+        # Song time, counting loops, at which the `count`-th note starts
+        loop, index = divmod(count, self.notes_per_loop)
+        return loop * self.duration + self.times[index]
@@ -0,0 +1,153 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# ==== SETTINGS ====
+THRESHOLD = 0.15                       # CMND dip that counts as the period (aubio's default)
+MIN_PERIOD = 2                         # Shortest period searched, in samples
+
+# Vectorised YIN pitch estimation for many frames at once.
+#
+# Frames are rows of a 2-D array, normally a strided view of the signal made
+# by frames(), so framing copies nothing.  For frames of length W the
+# difference function is integrated over the first W/2 samples and searched
+# for periods below W/2, as aubio does, and computed for all frames together:
+#
+#   d(tau) = e(0) + e(tau) - 2 r(tau)
+#
+# where e(tau) is the energy of the W/2 samples from tau (prefix sums) and
+# r(tau) the cross-correlation of the frame with its first half (real FFTs
+# of all frames at once).  The cumulative mean normalised difference (CMND) then
+# gives the period: the first dip below `threshold` that is followed by a
+# rise, else the deepest dip, refined by parabolic interpolation.  Confidence
+# is 1 - CMND at the chosen period, like aubio's.
+#
+# Every function returns one value per frame, so an array of n frames gives
+# arrays of shape (n,), and zero frames give empty arrays.  The cost per
+# frame is fixed and there is no Python loop over frames.
+
+# ==== FRAMING ====
+def frame_count(n_samples, frame_length, hop_length, center=False):
+    if center:
+        n_samples += 2 * (frame_length // 2)
+    if n_samples < frame_length:
+        return 0
+    return 1 + (n_samples - frame_length) // hop_length
+
+def frames(y, frame_length, hop_length, center=False):
+    # (n, frame_length) view of `y`; with center=True frame i is centred on
+    # sample i * hop_length, zero-padding the ends (a copy)
+    y = np.asarray(y, dtype=np.float32)
+    if center:
+        pad = frame_length // 2
+        y = np.pad(y, (pad, pad))
+    n = frame_count(len(y), frame_length, hop_length)
+    if n == 0:
+        return np.zeros((0, frame_length), dtype=np.float32)
+    return sliding_window_view(y, frame_length)[::hop_length][:n]
+
+def level_db(frames):
+    # Level of each frame in dB (aubio.db_spl): 10 log10 of the mean square
+    power = np.mean(np.square(frames, dtype=np.float64), axis=-1)
+    with np.errstate(divide="ignore"):
+        return 10 * np.log10(power)
+
+# ==== YIN ====
+def cmnd(frames, max_period=None):
+    # Cumulative mean normalised difference for periods 0..max_period
+    # (default frame_length // 2 - 1), shape (n, max_period + 1)
+    frames = np.asarray(frames, dtype=np.float64)
+    frame_length = frames.shape[-1]
+    w = frame_length // 2
+    m = w if max_period is None else min(max_period + 1, w)
+    # Lags below w do not wrap around in a circular correlation of this size
+    n_fft = 1 << (frame_length - 1).bit_length()
+    head = np.fft.rfft(frames[:, :w], n_fft)
+    np.conjugate(head, out=head)
+    head *= np.fft.rfft(frames, n_fft)
+    r = np.fft.irfft(head, n_fft)[:, :m]
+
+    energy = np.zeros((len(frames), w + m))
+    np.cumsum(np.square(frames[:, :w + m - 1]), axis=1, out=energy[:, 1:])
+    e = energy[:, w:w + m] - energy[:, :m]
+    d = e[:, :1] + e - 2 * r
+    np.maximum(d, 0, out=d)
+    d[:, 0] = 0
+
+    total = np.cumsum(d, axis=1)
+    d *= np.arange(m)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        result = np.where(total > 0, d / total, 1.0)
+    result[:, 0] = 1.0
+    return result
+
+def yin(frames, sample_rate, fmin=None, fmax=None, threshold=THRESHOLD):
+    # (pitch in Hz, confidence) of every frame, each of shape (n,).  Periods
+    # are searched between sample_rate / fmax and sample_rate / fmin.
+    frames = np.asarray(frames, dtype=np.float32)
+    if frames.ndim == 1:
+        frames = frames[np.newaxis]
+    n = len(frames)
+    if n == 0:
+        return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.float32)
+    w = frames.shape[1] // 2
+    lo = max(MIN_PERIOD, int(sample_rate / fmax)) if fmax else MIN_PERIOD
+    hi = min(w - 2, int(np.ceil(sample_rate / fmin))) if fmin else w - 2
+    c = cmnd(frames, hi + 1)
+    rows = np.arange(n)
+
+    # First period under the threshold that is lower than the next one,
+    # otherwise the global minimum of the searched range
+    search = c[:, lo:hi + 1]
+    dips = (search < threshold) & (search < c[:, lo + 1:hi + 2])
+    period = np.where(dips.any(axis=1), dips.argmax(axis=1), search.argmin(axis=1)) + lo
+
+    # Parabolic interpolation around the chosen period
+    s0, s1, s2 = c[rows, period - 1], c[rows, period], c[rows, period + 1]
+    curvature = s0 - 2 * s1 + s2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        shift = np.where(curvature != 0, 0.5 * (s0 - s2) / curvature, 0.0)
+    refined = period + np.clip(shift, -1, 1)
+
+    pitch = (sample_rate / refined).astype(np.float32)
+    confidence = np.clip(1 - s1, 0, 1).astype(np.float32)
+    return pitch, confidence
+
+def yin_signal(y, sample_rate, frame_length=2048, hop_length=None, center=True, **kwargs):
+    # yin() over a whole signal, one frame every hop_length samples
+    # (default frame_length // 4); frame_count() frames
+    hop_length = hop_length or frame_length // 4
+    return yin(frames(y, frame_length, hop_length, center), sample_rate, **kwargs)
+
+# ==== STREAMING ====
+# Front end for audio that arrives in blocks of any size.  Samples not yet
+# covered by a complete frame are kept between calls, so the frames are the
+# ones frames(all samples so far, frame_length, hop_length) would give.
+class YinStream:
+    def __init__(self, sample_rate, frame_length=2048, hop_length=None, **kwargs):
+        self.sample_rate = sample_rate
+        self.frame_length = frame_length
+        self.hop_length = hop_length or frame_length // 4
+        self.kwargs = kwargs
+        self.reset()
+
+    def reset(self):
+        self._pending = np.zeros(0, dtype=np.float32)
+        self.samples_seen = 0          # Samples passed to process() since reset()
+        self.frames_done = 0           # Frames returned since reset()
+
+    def process(self, block):
+        # (end, pitch, confidence, level in dB) arrays for the frames
+        # completed by `block`; `end` is the sample index (since reset) just
+        # after each frame
+        block = np.asarray(block, dtype=np.float32).reshape(-1)
+        data = np.concatenate((self._pending, block)) if len(self._pending) else block
+        self.samples_seen += len(block)
+        view = frames(data, self.frame_length, self.hop_length)
+        n = len(view)
+        ends = (self.frames_done + np.arange(n)) * self.hop_length + self.frame_length
+        pitch, confidence = yin(view, self.sample_rate, **self.kwargs)
+        levels = level_db(view)
+        # Keep what the next frame starts with
+        self._pending = data[n * self.hop_length:].copy()
+        self.frames_done += n
+        return ends, pitch, confidence, levels